@@ -1,16 +1,27 @@
 # imports
-import numpy as np
-import pandas as pd
-import joblib
-from fastapi import FastAPI
+import asyncio
+import hmac
+from contextlib import asynccontextmanager
+import io
+import tempfile
+import time
+from typing import Dict, List, Union
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import sklearn
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import OneHotEncoder
-from sklearn.preprocessing import StandardScaler
-from sklearn.compose import ColumnTransformer
-import warnings
-warnings.filterwarnings("ignore")
+import numpy as np
+import binary
+import bulk
+import config
+import metrics
+import search
+from batcher import MicroBatcher
+from cache import PredictionCache
+from inference import create_backend
+from profiler import SamplingProfiler
+from registry import ModelRegistry
+from reload import ModelReloader, latest_bundle
 
 description = """
 API used to predict the optimal price of a car rental, depending on its characteristics.
@@ -18,13 +29,88 @@ The goal is to help customers, in this case car owners, choose the best rental p
 
 ## Endpoints 
 * _predict_ - predict the optimal price of one car
+* _batch_predict_ - predict the optimal price of multiple cars in one request
+* _batch_predict_arrow_ - predict the optimal price of an Arrow IPC batch of cars, prices are returned as packed float64
+* _price_grid_ - predict the optimal price of one car over a grid of mileages, equipment or other features
+* _stream_predict_ - predict the optimal price of a NDJSON or CSV export of any size, results are streamed back
+* _cache_stats_ - hits, misses and size of the _predict_ cache
+* _metrics_ - Prometheus metrics: requests, latency of every prediction stage, batch sizes, cache and model version
+* _admin/reload_ - load a new model bundle in the background and swap it in, requires the admin token
+
+Every response has the version of the model that answered it in its X-Model-Version header.
 """
 
+# fit the preprocessor and load the model once per worker, instead of on every request
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # serve the newest bundle of the watched directory, if there is one
+    bundle = latest_bundle(config.MODEL_WATCH_PATH) if config.MODEL_WATCH_PATH else None
+    app.state.registry = ModelRegistry.from_files(compiled_path=bundle or config.COMPILED_PATH)
+    app.state.cache = PredictionCache(config.CACHE_SIZE, config.CACHE_TTL, config.CACHE_MILEAGE_BUCKET)
+    # concurrent /predict calls are predicted together
+    app.state.batcher = MicroBatcher() if config.MICROBATCH_DELAY > 0 else None
+    # batches are predicted by the configured backend, possibly spread over worker processes
+    app.state.backend = create_backend(app.state.registry, workers=config.INFERENCE_WORKERS)
+
+    app.state.reloader = ModelReloader(app)
+    app.state.reloader.path = bundle
+    watcher = asyncio.create_task(app.state.reloader.watch()) if config.MODEL_WATCH_PATH else None
+
+    metrics.MODEL_INFO.function = lambda: {(("version", app.state.registry.version),): 1}
+    metrics.CACHE.function = lambda: {
+        (("stat", stat.replace(" ", "_")),): value
+        for stat, value in app.state.cache.stats().items()
+        if stat in ("hits", "misses", "hit rate", "evictions", "size")
+    }
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    app.state.backend.close()
+
+
 app = FastAPI(
     title="Getaround: Car Rental Prediction",
-    description=description
+    description=description,
+    lifespan=lifespan
 )
 
+# count and time every request, and profile it when asked to
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    start = time.perf_counter()
+    if config.PROFILING and request.headers.get("x-profile") == "1":
+        with SamplingProfiler(config.PROFILING_INTERVAL) as profiler:
+            response = await call_next(request)
+            # streamed responses do their work while the body is sent
+            async for _ in response.body_iterator:
+                pass
+        response = PlainTextResponse(profiler.report(), status_code=response.status_code)
+    else:
+        response = await call_next(request)
+
+    # version of the model used by the endpoint, the model may have been reloaded since
+    version = getattr(request.state, "model_version", None) or request.app.state.registry.version
+    response.headers["X-Model-Version"] = version
+
+    route = request.scope.get("route")
+    endpoint = route.path if route is not None else "unmatched"
+    metrics.REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    if not hasattr(response, "body_iterator"):
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+        return response
+
+    # streamed responses (/stream_predict) are still working when call_next returns,
+    # the request is timed until the last byte of its body is sent
+    async def timed_body(body):
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+
+    response.body_iterator = timed_body(response.body_iterator)
+    return response
+
 class PredictionFeatures(BaseModel):
     model_key: str
     mileage: int
@@ -40,6 +126,45 @@ class PredictionFeatures(BaseModel):
     has_speed_regulator: int
     winter_tires: int
 
+class FeatureRange(BaseModel):
+    start: int
+    stop: int
+    step: int = 1
+
+
+class PriceGrid(BaseModel):
+    car: PredictionFeatures
+    grid: Dict[str, List[Union[int, str]]] = {}
+    ranges: Dict[str, FeatureRange] = {}
+
+def check_quantiles(quantiles):
+    if any(not 0 <= q <= 1 for q in quantiles):
+        raise HTTPException(status_code=422, detail=f"quantiles must be between 0 and 1, got {quantiles}")
+
+
+def spread_fields(std, values, quantiles, with_std, convert):
+    """
+    Standard deviation and quantiles of the estimators' prices, as returned by the prediction endpoints.
+
+    convert turns an array of values, one per predicted car, into the value returned by the endpoint.
+    """
+    fields = {}
+    if with_std:
+        fields["std"] = convert(std)
+    if quantiles:
+        fields["quantiles"] = {str(q): convert(row) for q, row in zip(quantiles, values)}
+    return fields
+
+
+def scatter(values, rows, n_rows):
+    """
+    Values of the predicted rows at their position in the request, None for the others.
+    """
+    out = [None] * n_rows
+    for row, value in zip(rows, values.tolist()):
+        out[row] = value
+    return out
+
 # "welcome" endpoint
 @app.get("/")
 async def welcome():
@@ -48,8 +173,11 @@ async def welcome():
 
 # create "predict" endpoint
 @app.post("/predict")
-def predict(PredictionFeatures: PredictionFeatures):
+async def predict(PredictionFeatures: PredictionFeatures, request: Request,
+            std: bool = False, quantiles: List[float] = Query(default=[])):
     """
+    With std=true or quantiles (e.g. ?quantiles=0.05&quantiles=0.95), the standard deviation and quantiles
+    of the prices predicted by every estimator of the served model are returned with the optimal price.\n
     Input Options:\n
     model_key: [Audi, BMW, Citroën, Peugeot, Renault, other]\n
     mileage: *number*\n
@@ -66,55 +194,216 @@ def predict(PredictionFeatures: PredictionFeatures):
     winter_tires: 0 (no), 1 (yes)
     """
     
-    # preprocess on pricing dataset, in order to obtain 
-    X = pd.read_csv("Data/preprocessed_X.csv")
-    X.drop(columns="Unnamed: 0", axis=1, inplace=True)
-
-    # change objects to categories
-    X["model_key"] = X["model_key"].astype("category")
-    X["fuel"] = X["fuel"].astype("category")
-    X["paint_color"] = X["paint_color"].astype("category")
-    X["car_type"] = X["car_type"].astype("category")
-
-    # preprocessing
-    cat_features = []
-    num_features = []
-
-    for col_name, col_type in X.dtypes.items():
-        if ((col_type=="category")):
-            cat_features.append(col_name)
-        elif col_type==np.int64:
-            num_features.append(col_name)
-
-    num_transformer = Pipeline(steps=[
-        ("standardization", StandardScaler())
-    ])
-
-    # bools are created from one hot encoding, so it is important to replace those values with binary code
-    cat_transformer = Pipeline(steps=[
-        ("one hot encoding", OneHotEncoder(drop="first"))
-    ])
-
-    # create preprocessor
-    # parameters: name, transformer, columns to be applied on
-    preprocessor = ColumnTransformer(transformers=[
-        ("numerical", num_transformer, num_features),
-        ("categorical", cat_transformer, cat_features)
-    ]) 
-
-    # fit preprocessor
-    X_preprocessed = preprocessor.fit_transform(X)
-
-   # read features into df
-    df = pd.DataFrame(dict(PredictionFeatures), index=[0])
-    df = preprocessor.transform(df)
-
-    # load model
-    model = joblib.load("final_model_api")
-
-    # make prediction
-    prediction = model.predict(df)
-
-    # return prediction in a list
-    returned_pred = {"optimal price": prediction.tolist()[0]}
-    return returned_pred
\ No newline at end of file
+    # make prediction with the preprocessor and model loaded at startup, unless the car is already cached
+    registry = request.app.state.registry
+    request.state.model_version = registry.version
+    features = dict(PredictionFeatures)
+    check_quantiles(quantiles)
+    try:
+        # encoding a single car takes microseconds, it is done on the event loop
+        with metrics.timed("encode"):
+            X = registry.encoder.encode(features)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if std or quantiles:
+        mean, spread, values = await run_in_threadpool(registry.predict_spread, X, quantiles)
+        return {"optimal price": float(mean[0]), **spread_fields(spread, values, quantiles, std, lambda a: float(a[0]))}
+
+    with metrics.timed("cache_and_predict"):
+        cache = request.app.state.cache
+        prediction = cache.get(features, registry.version)
+        if prediction is None:
+            batcher = request.app.state.batcher
+            if batcher is not None:
+                prediction = await batcher.predict(registry, X)
+            else:
+                prediction = (await run_in_threadpool(registry.predict_matrix, X))[0]
+            cache.put(features, registry.version, prediction)
+
+    # return prediction
+    returned_pred = {"optimal price": float(prediction)}
+    return returned_pred
+
+
+# create "cache_stats" endpoint
+@app.get("/cache_stats")
+async def cache_stats(request: Request):
+    """
+    Hits, misses, hit rate and size of the cache in front of _predict_, with the model version of the cached prices.
+    """
+    return request.app.state.cache.stats()
+
+
+# create "metrics" endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Metrics in the Prometheus text format.
+    """
+    return metrics.render()
+
+
+# create "admin/reload" endpoint
+@app.post("/admin/reload")
+def reload_model(request: Request, path: str = None, x_admin_token: str = Header(default="")):
+    """
+    Load a model bundle written by train.py, warm it up and swap it in, without restarting the API.\n
+    path is the bundle directory, by default the newest bundle of the watched directory.
+    Requests in flight finish on the previous model.\n
+    Requires the admin token in the X-Admin-Token header.
+    """
+    if not config.ADMIN_TOKEN or not hmac.compare_digest(x_admin_token, config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="admin endpoints need a valid X-Admin-Token")
+    try:
+        return request.app.state.reloader.reload(path)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+# create "batch_predict" endpoint
+@app.post("/batch_predict")
+def batch_predict(cars: List[PredictionFeatures], request: Request,
+                  std: bool = False, quantiles: List[float] = Query(default=[])):
+    """
+    Predict the optimal price of a list of cars, each car takes the same inputs as _predict_.\n
+    All cars are preprocessed and predicted together, which is much faster than one _predict_ call per car.\n
+    Cars that cannot be predicted get a null price and are listed in "errors" with their position in the list.\n
+    std and quantiles add the spread of the estimators' prices of every car, like in _predict_.
+    """
+    check_quantiles(quantiles)
+    if len(cars) > config.BATCH_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"too many cars: {len(cars)}, the maximum is {config.BATCH_MAX_ROWS}")
+
+    # the backend and its registry are read once, a model reload does not change them for this request
+    backend = request.app.state.backend
+    registry = backend.registry
+    request.state.model_version = registry.version
+    metrics.BATCH_SIZE.observe(len(cars), endpoint="batch_predict")
+    # encode all cars into one matrix, only predict rows without errors
+    X, valid_rows, errors = registry.encode_records([dict(car) for car in cars])
+    fields = {}
+    if std or quantiles:
+        mean, spread, values = backend.predict_spread(X, quantiles)
+        prices = scatter(mean, valid_rows, len(cars))
+        fields = spread_fields(spread, values, quantiles, std, lambda a: scatter(a, valid_rows, len(cars)))
+    elif valid_rows:
+        prices = scatter(backend.predict(X), valid_rows, len(cars))
+    else:
+        prices = [None] * len(cars)
+
+    returned_pred = {
+        "optimal price": prices,
+        **fields,
+        "errors": [{"row": row, "detail": detail} for row, detail in sorted(errors.items())]
+    }
+    return returned_pred
+
+
+# create "batch_predict_arrow" endpoint
+@app.post("/batch_predict_arrow")
+async def batch_predict_arrow(request: Request):
+    """
+    Predict the optimal price of a batch of cars sent as an Arrow IPC stream (application/vnd.apache.arrow.stream),
+    with one column per input of _predict_, categorical columns preferably dictionary encoded.\n
+    The columns are decoded straight into the model's features, without JSON parsing nor validation of every car.
+    Returns the prices as packed little endian float64 (application/octet-stream), one per car, in order.
+    Cars that cannot be predicted get NaN, their number is in the X-Invalid-Rows header,
+    send them to _batch_predict_ for the details.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type != binary.ARROW_STREAM:
+        raise HTTPException(status_code=415, detail=f"unsupported content type, use {binary.ARROW_STREAM}")
+    body = await request.body()
+
+    backend = request.app.state.backend
+    request.state.model_version = backend.registry.version
+
+    def score():
+        table = binary.read_table(body)
+        if table.num_rows > config.BATCH_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"too many cars: {table.num_rows}, the maximum is {config.BATCH_MAX_ROWS}")
+        metrics.BATCH_SIZE.observe(table.num_rows, endpoint="batch_predict_arrow")
+        with metrics.timed("transform"):
+            X, errors = binary.encode_table(backend.registry.encoder, table)
+        prices = np.full(table.num_rows, np.nan)
+        valid = np.ones(table.num_rows, dtype=bool)
+        valid[list(errors)] = False
+        if valid.any():
+            prices[valid] = backend.predict(X[valid])
+        return prices, len(errors)
+
+    # decoding and scoring run in the threadpool, like the other batch endpoints
+    try:
+        prices, n_errors = await run_in_threadpool(score)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return Response(binary.pack_prices(prices), media_type=binary.PRICES, headers={"X-Invalid-Rows": str(n_errors)})
+
+
+# create "price_grid" endpoint
+@app.post("/price_grid")
+def price_grid(PriceGrid: PriceGrid, request: Request):
+    """
+    Predict the optimal price of a car for every combination of values of some of its features.\n
+    car takes the same inputs as _predict_. grid lists the values of each varied feature, e.g.
+    {"has_gps": [0, 1], "fuel": ["diesel", "other"]}, and ranges gives numerical features as
+    {"mileage": {"start": 0, "stop": 200000, "step": 20000}}, stop included.\n
+    Returns the prices with one nested list level per varied feature, in the order of "features",
+    and the combination with the highest price in "best".
+    """
+    try:
+        values = search.grid_values(PriceGrid.grid, {feature: dict(bounds) for feature, bounds in PriceGrid.ranges.items()})
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    size = search.grid_size(values)
+    if size > config.GRID_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"too many combinations: {size}, the maximum is {config.GRID_MAX_SIZE}")
+
+    backend = request.app.state.backend
+    request.state.model_version = backend.registry.version
+    metrics.BATCH_SIZE.observe(size, endpoint="price_grid")
+    try:
+        return search.price_grid(backend.registry, dict(PriceGrid.car), values, backend.predict)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+# create "stream_predict" endpoint
+@app.post("/stream_predict")
+async def stream_predict(request: Request, chunk_size: int = config.STREAM_CHUNK_ROWS):
+    """
+    Predict the optimal price of every car of a NDJSON (application/x-ndjson) or CSV (text/csv) body.\n
+    Each line is a car with the same inputs as _predict_, a CSV body starts with a header line.\n
+    Cars are predicted chunk_size at a time (at most the limit of _batch_predict_) and results are sent back as soon as each chunk is done,
+    in the same format as the body: one line per car with its row number and optimal price, or an error.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    fmt = bulk.CONTENT_TYPES.get(content_type)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail=f"unsupported content type, use one of {list(bulk.CONTENT_TYPES)}")
+    if not 1 <= chunk_size <= config.BATCH_MAX_ROWS:
+        raise HTTPException(status_code=422, detail=f"chunk_size must be between 1 and {config.BATCH_MAX_ROWS}")
+
+    # spool the body to a temporary file while it is uploaded, only the last megabytes stay in memory,
+    # writes go to disk past them so they run in the threadpool
+    spool = tempfile.SpooledTemporaryFile(max_size=config.STREAM_SPOOL_BYTES)
+    try:
+        async for data in request.stream():
+            await run_in_threadpool(spool.write, data)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+
+    backend = request.app.state.backend
+    request.state.model_version = backend.registry.version
+
+    def results():
+        # starlette iterates over sync generators in its threadpool, so scoring does not block the event loop
+        with spool:
+            lines = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+            yield from bulk.score_lines(backend.registry, lines, fmt, chunk_size, backend)
+
+    media_type = "text/csv" if fmt == bulk.CSV else "application/x-ndjson"
+    return StreamingResponse(results(), media_type=media_type)
@@ -0,0 +1,78 @@
+"""
+Micro-batching of concurrent /predict calls.
+
+A single car costs nearly as much to predict as a few dozen: most of the time goes into the fixed cost
+of a predict call. Concurrent /predict calls therefore wait up to max_delay seconds, or until max_rows
+cars are waiting, and are predicted together in one call; each call then gets its own price back.
+
+Cars are grouped by the registry that encoded them, so a model reload never mixes two models in a batch.
+"""
+# imports
+import asyncio
+import time
+import numpy as np
+
+import config
+import metrics
+
+
+class MicroBatcher:
+    """
+    Collect encoded rows from concurrent requests and predict them in batches, on the event loop's executor.
+    """
+
+    def __init__(self, max_rows=config.MICROBATCH_MAX_ROWS, max_delay=config.MICROBATCH_DELAY):
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        # {registry: [(row, future, time it was queued), ...]}
+        self.pending = {}
+        self.timer = None
+        # running batches, referenced until they are done so that they are not garbage collected
+        self.tasks = set()
+
+    async def predict(self, registry, X):
+        """
+        Price of the single encoded row X, predicted by registry along with the other waiting rows.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self.pending.setdefault(registry, [])
+        batch.append((X, future, time.perf_counter()))
+        if len(batch) >= self.max_rows:
+            self._flush(registry)
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_delay, self._flush_all)
+        return await future
+
+    def _flush_all(self):
+        self.timer = None
+        for registry in list(self.pending):
+            self._flush(registry)
+
+    def _flush(self, registry):
+        batch = self.pending.pop(registry)
+        if not self.pending and self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        task = asyncio.get_running_loop().create_task(self._run(registry, batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, registry, batch):
+        start = time.perf_counter()
+        for _, _, queued in batch:
+            metrics.MICROBATCH_WAIT_SECONDS.observe(start - queued)
+        metrics.MICROBATCH_SIZE.observe(len(batch))
+
+        X = np.concatenate([row for row, _, _ in batch])
+        try:
+            prices = await asyncio.to_thread(registry.predict_matrix, X)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # requests cancelled while waiting, e.g. by a client disconnect, are already done
+        for (_, future, _), price in zip(batch, prices.tolist()):
+            if not future.done():
+                future.set_result(price)
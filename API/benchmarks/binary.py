@@ -0,0 +1,107 @@
+"""
+Compare /batch_predict (JSON) with /batch_predict_arrow (Arrow IPC in, packed float64 out) on the same cars,
+through the app in-process: prices must be identical, and the Arrow path should cost much less per car
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import List
+import numpy as np
+import pyarrow as pa
+from pydantic import TypeAdapter
+
+import binary
+from app import PredictionFeatures, app
+from registry import ModelRegistry
+from benchmarks.common import report, time_calls
+from benchmarks.encoder import pricing_features
+
+
+def arrow_body(cars):
+    # categorical columns are sent dictionary encoded
+    table = pa.Table.from_pandas(cars, preserve_index=False).combine_chunks()
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+async def run(bodies, calls):
+    import httpx
+
+    async def timed_calls(client, **request):
+        durations = np.empty(calls)
+        for i in range(calls + 1):
+            start = time.perf_counter()
+            response = await client.post(**request)
+            response.raise_for_status()
+            # first call is a warm-up
+            if i:
+                durations[i - 1] = (time.perf_counter() - start) * 1000
+        return response, durations
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            json_response, json_durations = await timed_calls(
+                client, url="/batch_predict", content=bodies["json"], headers={"Content-Type": "application/json"})
+            arrow_response, arrow_durations = await timed_calls(
+                client, url="/batch_predict_arrow", content=bodies["arrow"],
+                headers={"Content-Type": binary.ARROW_STREAM})
+    json_prices = np.array(json_response.json()["optimal price"], dtype=float)
+    arrow_prices = np.frombuffer(arrow_response.content, dtype="<f8")
+    return json_prices, json_durations, arrow_prices, arrow_durations
+
+
+def decode_json(registry, adapter, body):
+    # what /batch_predict does before predicting
+    cars = adapter.validate_python(json.loads(body))
+    return registry.encode_records([dict(car) for car in cars])[0]
+
+
+def decode_arrow(registry, body):
+    return binary.encode_table(registry.encoder, binary.read_table(body))[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--calls", type=int, default=20)
+    args = parser.parse_args()
+
+    registry = ModelRegistry.from_files()
+    cars = pricing_features(registry)
+    cars = cars.sample(args.rows, replace=True, random_state=0).reset_index(drop=True)
+    for col in registry.categorical_features:
+        cars[col] = cars[col].astype("category")
+
+    bodies = {
+        "json": json.dumps(cars.astype(object).to_dict(orient="records")).encode(),
+        "arrow": arrow_body(cars),
+    }
+    print(f"cars: {len(cars)}, json body: {len(bodies['json']) / 1024:.0f} KiB, arrow body: {len(bodies['arrow']) / 1024:.0f} KiB")
+
+    json_prices, json_durations, arrow_prices, arrow_durations = asyncio.run(run(bodies, args.calls))
+    identical = np.array_equal(json_prices, arrow_prices)
+    print(f"identical prices: {identical}")
+    if not identical:
+        sys.exit(1)
+
+    # decoding on its own, from the request body to the feature matrix
+    adapter = TypeAdapter(List[PredictionFeatures])
+    if not np.array_equal(decode_json(registry, adapter, bodies["json"]), decode_arrow(registry, bodies["arrow"])):
+        print("decoded features differ")
+        sys.exit(1)
+    json_p50, _ = report("decode json", time_calls(lambda: decode_json(registry, adapter, bodies["json"]), args.calls))
+    arrow_p50, _ = report("decode arrow", time_calls(lambda: decode_arrow(registry, bodies["arrow"]), args.calls))
+    print(f"decode p50 speedup: {json_p50 / arrow_p50:.1f}x")
+
+    json_p50, _ = report("/batch_predict (json)", json_durations)
+    arrow_p50, _ = report("/batch_predict_arrow", arrow_durations)
+    print(f"p50 speedup: {json_p50 / arrow_p50:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# helpers shared by the benchmark scripts
+# run every benchmark from the API folder, e.g. python -m benchmarks.latency
+import json
+import time
+import numpy as np
+import pandas as pd
+
+SAMPLE_PATH = "test_data.txt"
+
+
+def load_sample(path=SAMPLE_PATH):
+    """
+    Single car used as request body by the benchmarks.
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def sample_frame(path=SAMPLE_PATH):
+    return pd.DataFrame(load_sample(path), index=[0])
+
+
+def time_calls(func, n_calls, warmup=1):
+    """
+    Call func n_calls times and return the duration of every call in milliseconds.
+    """
+    for _ in range(warmup):
+        func()
+    durations = np.empty(n_calls)
+    for i in range(n_calls):
+        start = time.perf_counter()
+        func()
+        durations[i] = (time.perf_counter() - start) * 1000
+    return durations
+
+
+def report(name, durations):
+    """
+    Print p50/p99 latency of a list of durations in milliseconds.
+    """
+    p50, p99 = np.percentile(durations, [50, 99])
+    print(f"{name:<30} calls: {len(durations):>6}  p50: {p50:9.3f} ms  p99: {p99:9.3f} ms")
+    return p50, p99
@@ -0,0 +1,78 @@
+"""
+Check that FeatureEncoder gives the same features as preprocessor.transform,
+over every car of the pricing dataset, and compare their speed
+"""
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+import config
+from encoder import FeatureEncoder
+from registry import ENCODER_FILE, ModelRegistry
+from benchmarks.common import load_sample, sample_frame, time_calls, report
+
+PRICING_PATH = "Data/get_around_pricing_project.csv"
+
+
+def pricing_features(registry, path=PRICING_PATH):
+    """
+    Cars of the raw pricing dataset, cleaned like in the notebook: bools as 0/1 and rare classes as "other".
+    """
+    df = pd.read_csv(path)
+    df = df[df["mileage"] >= 0]
+    df = df[registry.feature_names]
+    for col in registry.numerical_features:
+        df[col] = df[col].astype(np.int64)
+    for col, lookup in zip(registry.encoder.categorical_features, registry.encoder.category_columns):
+        df[col] = df[col].where(df[col].isin(list(lookup)), "other")
+    return df
+
+
+def check_equivalence(registry, df):
+    expected = registry.preprocessor.transform(df)
+    if hasattr(expected, "toarray"):
+        expected = expected.toarray()
+
+    # whole frame at once, and row by row through a single preallocated row
+    frame = registry.encoder.transform(df)
+    rows = np.empty_like(expected)
+    out = np.empty((1, registry.encoder.n_columns))
+    for i, features in enumerate(df.to_dict(orient="records")):
+        rows[i] = registry.encoder.encode(features, out=out)[0]
+
+    ok = np.array_equal(frame, expected) and np.array_equal(rows, expected)
+    print(f"rows: {len(df)}, columns: {expected.shape[1]}, identical to preprocessor.transform: {ok}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    # the preprocessor is only fitted when the exported arrays are not used
+    registry = ModelRegistry.from_files(compiled_path=None)
+    df = pricing_features(registry)
+    if not check_equivalence(registry, df):
+        sys.exit(1)
+
+    # the encoder saved with the exported arrays, read back from json, must encode identically
+    encoder_path = os.path.join(config.COMPILED_PATH, ENCODER_FILE)
+    if os.path.exists(encoder_path):
+        exported = np.array_equal(FeatureEncoder.load(encoder_path).transform(df), registry.encoder.transform(df))
+        print(f"exported encoder identical: {exported}")
+        if not exported:
+            sys.exit(1)
+
+    features = load_sample()
+    df = sample_frame()
+    out = np.empty((1, registry.encoder.n_columns))
+    sklearn_p50, _ = report("preprocessor.transform", time_calls(lambda: registry.preprocessor.transform(df), args.calls))
+    encoder_p50, _ = report("encoder.encode", time_calls(lambda: registry.encoder.encode(features, out=out), args.calls))
+    print(f"p50 speedup: {sklearn_p50 / encoder_p50:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Check that the flattened ensemble predicts exactly like the BaggingRegressor,
+and compare their speed on a single row and on batches
+"""
+import argparse
+import sys
+import numpy as np
+
+from compiled import CompiledEnsemble
+from registry import ModelRegistry
+from benchmarks.common import time_calls, report
+from benchmarks.encoder import pricing_features
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[10, 100, 1000, 4842])
+    args = parser.parse_args()
+
+    # the sklearn model is needed for the comparison, never load the exported arrays instead
+    registry = ModelRegistry.from_files(compiled_path=None)
+    X = registry.encoder.transform(pricing_features(registry))
+    compiled = CompiledEnsemble.from_bagging(registry.model)
+
+    identical = np.array_equal(compiled.predict(X), registry.model.predict(X))
+    print(f"rows: {len(X)}, estimators: {compiled.n_estimators}, identical to model.predict: {identical}")
+    if not identical:
+        sys.exit(1)
+
+    row = X[:1]
+    sklearn_p50, _ = report("model.predict, 1 row", time_calls(lambda: registry.model.predict(row), args.calls))
+    compiled_p50, _ = report("compiled.predict, 1 row", time_calls(lambda: compiled.predict(row), args.calls))
+    print(f"per row speedup: {sklearn_p50 / compiled_p50:.1f}x")
+
+    for size in args.batch_sizes:
+        batch = X[:size]
+        calls = max(3, args.calls // size)
+        sklearn_p50, _ = report(f"model.predict, {size} rows", time_calls(lambda: registry.model.predict(batch), calls))
+        compiled_p50, _ = report(f"compiled.predict, {size} rows", time_calls(lambda: compiled.predict(batch), calls))
+        print(f"batch of {size} speedup: {sklearn_p50 / compiled_p50:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Check that the spread of the flattened ensemble matches the predictions of every sklearn estimator,
+and compare the cost of the mean alone, of the mean with std and quantiles, and of looping over estimators_
+"""
+import argparse
+import sys
+import numpy as np
+
+from compiled import CompiledEnsemble
+from registry import ModelRegistry
+from benchmarks.common import time_calls, report
+from benchmarks.encoder import pricing_features
+
+QUANTILES = [0.05, 0.5, 0.95]
+
+
+def estimator_predictions(model, X):
+    # what a Python loop over the fitted estimators gives
+    return np.stack([estimator.predict(X[:, features])
+                     for estimator, features in zip(model.estimators_, model.estimators_features_)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 100, 1000])
+    args = parser.parse_args()
+
+    registry = ModelRegistry.from_files(compiled_path=None)
+    X = registry.encoder.transform(pricing_features(registry))
+    compiled = CompiledEnsemble.from_bagging(registry.model)
+
+    mean, std, quantiles = compiled.predict_spread(X, QUANTILES)
+    predictions = estimator_predictions(registry.model, X)
+    identical = (np.array_equal(mean, registry.model.predict(X)) and np.array_equal(std, predictions.std(axis=0))
+                 and np.array_equal(quantiles, np.quantile(predictions, QUANTILES, axis=0)))
+    print(f"rows: {len(X)}, mean, std and quantiles identical to the sklearn estimators: {identical}")
+    if not identical:
+        sys.exit(1)
+
+    for size in args.batch_sizes:
+        batch = X[:size]
+        calls = max(3, args.calls // size)
+        mean_p50, _ = report(f"predict, {size} rows", time_calls(lambda: compiled.predict(batch), calls))
+        spread_p50, _ = report(f"predict_spread, {size} rows",
+                               time_calls(lambda: compiled.predict_spread(batch, QUANTILES), calls))
+        loop_p50, _ = report(f"estimators_ loop, {size} rows",
+                             time_calls(lambda: estimator_predictions(registry.model, batch), calls))
+        print(f"spread overhead: {spread_p50 / mean_p50 - 1:+.0%}, speedup over the loop: {loop_p50 / spread_p50:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
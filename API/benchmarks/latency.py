@@ -0,0 +1,36 @@
+"""
+Compare /predict latency when the preprocessor and model are rebuilt on every call
+against the registry that builds them once at startup
+"""
+import argparse
+import joblib
+
+import config
+from registry import ModelRegistry, build_preprocessor, load_training_features
+from benchmarks.common import sample_frame, time_calls, report
+
+
+def per_request_predict(df):
+    # what /predict used to do on every call
+    preprocessor = build_preprocessor(load_training_features(config.DATA_PATH))
+    model = joblib.load(config.MODEL_PATH)
+    return model.predict(preprocessor.transform(df))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--per-request-calls", type=int, default=20,
+                        help="rebuilding everything is slow, so fewer calls are made for it")
+    args = parser.parse_args()
+
+    df = sample_frame()
+    registry = ModelRegistry.from_files()
+
+    old_p50, _ = report("per request (before)", time_calls(lambda: per_request_predict(df), args.per_request_calls))
+    new_p50, _ = report("registry (startup)", time_calls(lambda: registry.predict(df), args.calls))
+    print(f"p50 speedup: {old_p50 / new_p50:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Throughput and latency of concurrent single car /predict calls, with and without micro-batching,
+through the app in-process and without the cache, every car of the pricing dataset is sent once
+"""
+import argparse
+import asyncio
+import time
+import numpy as np
+
+from batcher import MicroBatcher
+from cache import PredictionCache
+from registry import ModelRegistry
+from benchmarks.encoder import pricing_features
+
+
+async def load_test(app, cars, concurrency):
+    import httpx
+
+    durations = []
+    queue = list(reversed(cars))
+
+    async def user(client):
+        while queue:
+            car = queue.pop()
+            start = time.perf_counter()
+            response = await client.post("/predict", json=car)
+            response.raise_for_status()
+            durations.append((time.perf_counter() - start) * 1000)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(user(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return len(cars) / elapsed, np.percentile(durations, [50, 99])
+
+
+async def run(cars, concurrency, delays, max_rows):
+    from app import app
+
+    async with app.router.lifespan_context(app):
+        app.state.cache = PredictionCache(maxsize=0)
+        for delay in delays:
+            app.state.batcher = MicroBatcher(max_rows, delay / 1000) if delay > 0 else None
+            throughput, (p50, p99) = await load_test(app, cars, concurrency)
+            name = f"batching, {delay:g} ms" if delay > 0 else "no batching"
+            print(f"{name:<20} {throughput:8.0f} requests/s  p50: {p50:7.2f} ms  p99: {p99:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--delays", type=float, nargs="+", default=[0, 1, 2, 5], help="milliseconds, 0 disables batching")
+    parser.add_argument("--max-rows", type=int, default=64)
+    args = parser.parse_args()
+
+    registry = ModelRegistry.from_files()
+    cars = pricing_features(registry).to_dict(orient="records")
+    print(f"cars: {len(cars)}, concurrency: {args.concurrency}")
+    asyncio.run(run(cars, args.concurrency, args.delays, args.max_rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Throughput of batch scoring with the process pool backend, for 1 worker up to every core
+"""
+import argparse
+import os
+import time
+import numpy as np
+
+from inference import LocalBackend, ProcessPoolBackend
+from registry import ModelRegistry
+from benchmarks.encoder import pricing_features
+
+
+def throughput(backend, X, repeats):
+    backend.predict(X[:backend.workers * 1000])
+    start = time.perf_counter()
+    for _ in range(repeats):
+        backend.predict(X)
+    return repeats * len(X) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    registry = ModelRegistry.from_files()
+    X = registry.encoder.transform(pricing_features(registry))
+    X = np.resize(X, (args.rows, X.shape[1]))
+    print(f"rows per batch: {len(X)}, cores: {os.cpu_count()}")
+
+    local = throughput(LocalBackend(registry), X, args.repeats)
+    print(f"{'local':<12} {local:>10.0f} rows/s")
+    for workers in range(1, args.max_workers + 1):
+        backend = ProcessPoolBackend(registry, workers=workers)
+        rows_per_second = throughput(backend, X, args.repeats)
+        backend.close()
+        print(f"{workers:>2} workers   {rows_per_second:>10.0f} rows/s  ({rows_per_second / local:.2f}x local)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Cold start of the API: import time of app.py and time to the first /predict response,
+serving the exported arrays (NumPy only) against fitting the preprocessor and unpickling the sklearn model
+
+every run is a fresh interpreter, export the arrays first with python compiled.py final_model_api
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+from benchmarks.common import SAMPLE_PATH
+
+# run in a fresh interpreter, prints its timings as json
+CHILD = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+
+async def first_prediction():
+    import httpx
+    async with app.app.router.lifespan_context(app.app):
+        loaded = time.perf_counter()
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            response = await client.post("/predict", json=json.load(open(sys.argv[1])))
+            response.raise_for_status()
+    return loaded
+
+loaded = asyncio.run(first_prediction())
+predicted = time.perf_counter()
+print(json.dumps({
+    "import app": imported - start,
+    "load model": loaded - imported,
+    "first prediction": predicted - start,
+    "heavy modules": [name for name in ("pandas", "sklearn", "joblib", "scipy") if name in sys.modules],
+}))
+"""
+
+SCENARIOS = {
+    "exported arrays": {},
+    "sklearn model": {"GETAROUND_COMPILED_PATH": "no_exported_arrays"},
+}
+
+
+def cold_start(env):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", CHILD, SAMPLE_PATH], env={**os.environ, **env},
+                            capture_output=True, text=True, check=True).stdout
+    timings = json.loads(output.splitlines()[-1])
+    timings["process"] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for name, env in SCENARIOS.items():
+        runs = [cold_start(env) for _ in range(args.runs)]
+        medians = {key: np.median([run[key] for run in runs]) * 1000
+                   for key in ("import app", "load model", "first prediction", "process")}
+        print(f"{name:<16} " + "  ".join(f"{key}: {value:7.0f} ms" for key, value in medians.items()))
+        print(f"{'':<16} heavy modules loaded: {runs[0]['heavy modules'] or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
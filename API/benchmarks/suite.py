@@ -0,0 +1,192 @@
+"""
+Reproducible load test of the API and micro-benchmarks of the model,
+compared against a stored baseline: exits 1 when a result regresses
+
+  python -m benchmarks.suite                   run and compare against benchmarks/baseline.json
+  python -m benchmarks.suite --save-baseline   run and store the results as the new baseline
+
+the baseline holds absolute timings, so it is only meaningful on the machine it was saved on,
+and it stores the parameters of its run: results are only compared to a baseline run with the same parameters
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import numpy as np
+
+from registry import ModelRegistry
+from benchmarks.common import time_calls
+from benchmarks.encoder import pricing_features
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# arguments that change what is measured, they must be the same as the baseline's to compare
+PARAMETERS = ["requests", "concurrency", "batch_share", "batch_size", "calls", "seed"]
+
+
+def request_mix(cars, n_requests, batch_share, batch_size, seed):
+    """
+    Requests drawn from the pricing dataset: mostly single cars, popular ones more often than others
+    like real traffic (which also exercises the /predict cache), and some batches.
+    """
+    rng = np.random.default_rng(seed)
+    records = cars.to_dict(orient="records")
+    # zipf-like popularity over a shuffled order of the cars
+    popularity = 1 / np.arange(1, len(records) + 1)
+    popularity = rng.permutation(popularity / popularity.sum())
+    requests = []
+    for _ in range(n_requests):
+        if rng.random() < batch_share:
+            rows = rng.choice(len(records), size=batch_size)
+            requests.append(("/batch_predict", [records[i] for i in rows]))
+        else:
+            requests.append(("/predict", records[rng.choice(len(records), p=popularity)]))
+    return requests
+
+
+def micro_benchmarks(registry, cars, calls):
+    """
+    p50 and p99 in milliseconds of every prediction stage on its own.
+    """
+    features = cars.iloc[0].to_dict()
+    frame = cars.iloc[:100]
+    row = registry.encoder.encode(features)
+    X = registry.transform(frame)
+    stages = {
+        "encode 1 car": lambda: registry.encoder.encode(features),
+        "transform 100 cars": lambda: registry.transform(frame),
+        "predict 1 car": lambda: registry.predict_matrix(row),
+        "predict 100 cars": lambda: registry.predict_matrix(X),
+    }
+    results = {}
+    for name, func in stages.items():
+        p50, p99 = np.percentile(time_calls(func, calls, warmup=10), [50, 99])
+        results[name] = {"p50 ms": p50, "p99 ms": p99}
+    return results
+
+
+async def load_test(requests, concurrency):
+    """
+    Send the requests to the app in-process, concurrency at a time, and return throughput and latency.
+    """
+    import httpx
+    from app import app
+
+    durations = {}
+    queue = list(reversed(requests))
+
+    async def user(client):
+        while queue:
+            path, body = queue.pop()
+            start = time.perf_counter()
+            response = await client.post(path, json=body)
+            response.raise_for_status()
+            durations.setdefault(path, []).append((time.perf_counter() - start) * 1000)
+
+    # the transport does not run the lifespan, so the registry is loaded here
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(user(client) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+
+    results = {"all": {"requests/s": len(requests) / elapsed}}
+    for path, values in sorted(durations.items()):
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        results[path] = {"requests": len(values), "p50 ms": p50, "p95 ms": p95, "p99 ms": p99}
+    return results
+
+
+def regressions(results, baseline, tolerance, min_ms):
+    """
+    Every result worse than its baseline by more than tolerance: slower latencies, lower throughputs,
+    and every baseline result missing from the results.
+
+    Latencies must also be min_ms slower than the baseline, so that noise on timings of a few microseconds
+    is not reported as a regression.
+    """
+    found = []
+    for section, entries in baseline.items():
+        for name, metrics in entries.items():
+            for metric, expected in metrics.items():
+                if metric == "requests":
+                    continue
+                actual = results.get(section, {}).get(name, {}).get(metric)
+                if actual is None:
+                    found.append(f"{section} / {name} / {metric}: missing from the results")
+                    continue
+                if metric.endswith("/s"):
+                    worse = actual < expected / (1 + tolerance)
+                else:
+                    worse = actual > expected * (1 + tolerance) and actual - expected > min_ms
+                if worse:
+                    found.append(f"{section} / {name} / {metric}: {actual:.3f} against {expected:.3f}")
+    return found
+
+
+def print_results(results):
+    for section, entries in results.items():
+        print(section)
+        for name, metrics in entries.items():
+            values = "  ".join(f"{metric}: {value:9.3f}" if isinstance(value, float) else f"{metric}: {value}"
+                               for metric, value in metrics.items())
+            print(f"  {name:<20} {values}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-share", type=float, default=0.05, help="share of requests sent to /batch_predict")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--calls", type=int, default=500, help="calls per micro-benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed slowdown before failing, 0.5 is 50%% slower than the baseline")
+    parser.add_argument("--min-ms", type=float, default=0.1,
+                        help="smallest latency increase in milliseconds reported as a regression")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    parameters = {name: getattr(args, name) for name in PARAMETERS}
+    baseline = None
+    if not args.save_baseline:
+        if not os.path.exists(args.baseline):
+            print(f"no baseline at {args.baseline}, run with --save-baseline first")
+            return
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        # checked before running, results of other parameters cannot be compared
+        if baseline.get("parameters") != parameters:
+            sys.exit(f"the baseline was run with {baseline.get('parameters')}, not {parameters}: "
+                     "run with the same parameters, or save a new baseline")
+
+    registry = ModelRegistry.from_files()
+    cars = pricing_features(registry)
+    requests = request_mix(cars, args.requests, args.batch_share, args.batch_size, args.seed)
+
+    results = {
+        "micro": micro_benchmarks(registry, cars, args.calls),
+        "load": asyncio.run(load_test(requests, args.concurrency)),
+    }
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"parameters": parameters, "results": results}, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return
+    found = regressions(results, baseline["results"], args.tolerance, args.min_ms)
+    for line in found:
+        print(f"REGRESSION {line}")
+    if found:
+        sys.exit(1)
+    print("no regression against the baseline")
+
+
+if __name__ == "__main__":
+    main()
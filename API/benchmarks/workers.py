@@ -0,0 +1,75 @@
+"""
+Startup time and memory of N workers loading the model with joblib, or memory mapping the exported arrays
+
+export the arrays first with: python compiled.py final_model_api --output final_model_api_arrays
+"""
+import argparse
+import subprocess
+import sys
+import time
+import numpy as np
+
+import config
+
+MODES = ["joblib", "arrays"]
+
+
+def child(mode):
+    # load the model like a worker would, predict once to touch it, then wait for the parent
+    start = time.perf_counter()
+    if mode == "joblib":
+        import joblib
+        model = joblib.load(config.MODEL_PATH)
+    else:
+        from compiled import CompiledEnsemble
+        model = CompiledEnsemble.load(config.COMPILED_PATH, mmap_mode="r")
+    model.predict(np.zeros((100, model.n_features_in_ if mode == "joblib" else model.n_features)))
+    print(f"{(time.perf_counter() - start) * 1000:.1f}", flush=True)
+    sys.stdin.readline()
+
+
+def memory(pid):
+    """
+    Rss, Pss (shared pages divided between the processes using them) and private memory of a process, in MB.
+    """
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return values["Rss"], values["Pss"], values["Private_Clean"] + values["Private_Dirty"]
+
+
+def run(mode, workers):
+    processes = [
+        subprocess.Popen([sys.executable, "-m", "benchmarks.workers", "--child", mode],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    startup = [float(process.stdout.readline()) for process in processes]
+    rss, pss, private = np.array([memory(process.pid) for process in processes]).T
+    for process in processes:
+        process.communicate("\n")
+
+    print(f"{mode:<8} workers: {workers}  load p50: {np.median(startup):8.1f} ms  "
+          f"per worker Rss: {rss.mean():6.1f} MB  Pss: {pss.mean():6.1f} MB  private: {private.mean():6.1f} MB  "
+          f"total Pss: {pss.sum():7.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+    for mode in MODES:
+        for workers in args.workers:
+            run(mode, workers)
+
+
+if __name__ == "__main__":
+    main()
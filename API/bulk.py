@@ -0,0 +1,183 @@
+"""
+Score large NDJSON or CSV exports chunk by chunk.
+
+Used by the /stream_predict endpoint and as a command line tool:
+
+    python bulk.py cars.csv --output prices.csv
+    python bulk.py cars.ndjson --chunk-size 5000 > prices.ndjson
+
+Rows are read, scored and written one chunk at a time, so memory depends on the chunk size
+and not on the size of the input. Output has the same format as the input, with one line per input row:
+its position, its optimal price, or an error when the row cannot be scored.
+"""
+# imports
+# pandas is imported when the first chunk is parsed, importing bulk from the API does not load it
+import argparse
+import csv
+import io
+import json
+import sys
+import numpy as np
+
+import config
+import metrics
+
+NDJSON = "ndjson"
+CSV = "csv"
+
+# content types accepted by /stream_predict
+CONTENT_TYPES = {
+    "application/x-ndjson": NDJSON,
+    "application/jsonl": NDJSON,
+    "text/csv": CSV,
+}
+
+# boolean flags may be exported as True/False instead of 1/0
+BOOL_VALUES = {"True": 1, "False": 0, "true": 1, "false": 0, True: 1, False: 0}
+
+
+def parse_chunk(lines, fmt, header=None):
+    """
+    Read a list of text lines into a dataframe.
+
+    Returns the dataframe and a dictionary {row position: error message} for lines that could not be parsed.
+    """
+    import pandas as pd
+
+    records = []
+    errors = {}
+    if fmt == CSV:
+        try:
+            columns = next(csv.reader([header], strict=True), [])
+        except csv.Error as e:
+            return pd.DataFrame(index=range(len(lines))), {row: f"invalid csv header: {e}" for row in range(len(lines))}
+        # line by line, so that a malformed line is an error for that row only
+        for row, line in enumerate(lines):
+            try:
+                values = next(csv.reader([line], strict=True), [])
+            except csv.Error as e:
+                errors[row] = f"invalid csv: {e}"
+            else:
+                if len(values) != len(columns):
+                    errors[row] = f"expected {len(columns)} fields, got {len(values)}"
+            records.append({} if row in errors else dict(zip(columns, values)))
+        return pd.DataFrame.from_records(records, index=range(len(lines))), errors
+
+    for row, line in enumerate(lines):
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("a row must be a json object")
+        except ValueError as e:
+            errors[row] = f"invalid json: {e}"
+            record = {}
+        records.append(record)
+    return pd.DataFrame.from_records(records, index=range(len(lines))), errors
+
+
+def clean_chunk(registry, df, errors):
+    """
+    Keep the columns used by the model and convert numbers, adding an error for every invalid row.
+    """
+    import pandas as pd
+
+    df = df.reindex(columns=registry.feature_names)
+
+    for col in registry.numerical_features:
+        values = df[col].replace(BOOL_VALUES)
+        df[col] = pd.to_numeric(values, errors="coerce")
+
+    # missing values and numbers that could not be converted
+    missing = df.isna() | df.eq("")
+    for row in np.flatnonzero(missing.any(axis=1).to_numpy()):
+        columns = list(df.columns[missing.iloc[row].to_numpy()])
+        errors.setdefault(int(row), f"missing or invalid values for {columns}")
+
+    for row, detail in registry.row_errors(df.fillna("")).items():
+        errors.setdefault(row, detail)
+    return df, errors
+
+
+def score_chunk(registry, lines, fmt, header=None, first_row=0, backend=None):
+    """
+    Score a chunk of input lines and return the output lines for them.
+
+    first_row is the position of the chunk's first line in the whole input, so that row numbers are global.
+    backend is an inference backend running the model, by default the registry predicts in the calling thread.
+    """
+    metrics.BATCH_SIZE.observe(len(lines), endpoint="stream_predict")
+    with metrics.timed("parse"):
+        df, errors = parse_chunk(lines, fmt, header)
+        df, errors = clean_chunk(registry, df, errors)
+
+    prices = np.full(len(df), np.nan)
+    valid_rows = [row for row in range(len(df)) if row not in errors]
+    if valid_rows:
+        predict = registry.predict_matrix if backend is None else backend.predict
+        prices[valid_rows] = predict(registry.transform(df.iloc[valid_rows]))
+
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    for row, price in enumerate(prices.tolist()):
+        if fmt == CSV:
+            writer.writerow([first_row + row, "" if row in errors else price, errors.get(row, "")])
+        elif row in errors:
+            out.write(json.dumps({"row": first_row + row, "error": errors[row]}) + "\n")
+        else:
+            out.write(json.dumps({"row": first_row + row, "optimal price": price}) + "\n")
+    return out.getvalue()
+
+
+def output_header(fmt):
+    return "row,optimal price,error\n" if fmt == CSV else ""
+
+
+def score_lines(registry, lines, fmt, chunk_size=config.STREAM_CHUNK_ROWS, backend=None):
+    """
+    Score an iterable of text lines, yielding the output text chunk by chunk.
+    """
+    lines = (line.rstrip("\r\n") for line in lines)
+    header = next(lines, None) if fmt == CSV else None
+
+    yield output_header(fmt)
+    chunk = []
+    first_row = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield score_chunk(registry, chunk, fmt, header, first_row, backend)
+            first_row += len(chunk)
+            chunk = []
+    if chunk:
+        yield score_chunk(registry, chunk, fmt, header, first_row, backend)
+
+
+def main():
+    from inference import create_backend
+    from registry import ModelRegistry
+
+    parser = argparse.ArgumentParser(description="Score a NDJSON or CSV file of cars chunk by chunk.")
+    parser.add_argument("input", help="input file, - to read from stdin")
+    parser.add_argument("--output", default="-", help="output file, - (default) to write to stdout")
+    parser.add_argument("--format", choices=[NDJSON, CSV], help="defaults to the input file extension")
+    parser.add_argument("--chunk-size", type=int, default=config.STREAM_CHUNK_ROWS)
+    parser.add_argument("--backend", default=config.INFERENCE_BACKEND, help="local or process")
+    parser.add_argument("--workers", type=int, default=config.INFERENCE_WORKERS)
+    args = parser.parse_args()
+
+    fmt = args.format or (CSV if args.input.endswith(".csv") else NDJSON)
+    registry = ModelRegistry.from_files()
+    backend = create_backend(registry, args.backend, workers=args.workers)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    target = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    with source, target:
+        for text in score_lines(registry, source, fmt, args.chunk_size, backend):
+            target.write(text)
+    backend.close()
+
+
+if __name__ == "__main__":
+    main()
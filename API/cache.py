@@ -0,0 +1,95 @@
+# imports
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """
+    In-process LRU cache of predicted prices, with an optional time to live.
+
+    Keys are the normalized request features, optionally with the mileage rounded down to a bucket
+    so that cars with almost the same mileage share a price. Every entry remembers the version of the model
+    that predicted it, entries of another version are treated as misses and the cache is cleared
+    as soon as a different model version is seen.
+    """
+
+    def __init__(self, maxsize=10000, ttl=None, mileage_bucket=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.mileage_bucket = mileage_bucket
+        self.model_version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, features):
+        """
+        Canonical key of a dictionary of features: sorted names, ints for numbers and bucketed mileage.
+        """
+        key = []
+        for name in sorted(features):
+            value = features[name]
+            if isinstance(value, str):
+                value = value.strip()
+            elif name == "mileage" and self.mileage_bucket:
+                value = int(value) // self.mileage_bucket * self.mileage_bucket
+            else:
+                value = int(value)
+            key.append((name, value))
+        return tuple(key)
+
+    def _check_version(self, model_version):
+        # a new model makes every cached price stale
+        if model_version != self.model_version:
+            self._entries.clear()
+            self.model_version = model_version
+
+    def get(self, features, model_version):
+        """
+        Return the cached price of a car, or None.
+        """
+        if not self.maxsize:
+            return None
+        key = self.key(features)
+        with self._lock:
+            self._check_version(model_version)
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, features, model_version, price):
+        if not self.maxsize:
+            return
+        key = self.key(features)
+        with self._lock:
+            self._check_version(model_version)
+            self._entries[key] = (price, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit rate": self.hits / requests if requests else 0.0,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "mileage bucket": self.mileage_bucket,
+                "model version": self.model_version,
+            }
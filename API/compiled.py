@@ -0,0 +1,254 @@
+"""
+Flat, array based copy of the fitted BaggingRegressor.
+
+sklearn predicts with the ensemble by calling predict on each of its estimators, one after the other.
+Here every tree is flattened into contiguous NumPy arrays (feature, threshold, children and leaf value per node,
+with the nodes of all trees concatenated), and a batch of rows walks all trees at once,
+one tree level per step. Ensembles of linear models are stored as one row of coefficients per estimator,
+over the columns selected for it. Predictions are bit for bit identical to model.predict.
+
+Export the model once with:
+
+    python compiled.py final_model_api --output final_model_api_arrays
+
+The export is a directory with one raw .npy file per array, and the encoder of the preprocessor (encoder.json)
+so that the API can serve the export with NumPy only. Loading it with mmap_mode="r" maps the files
+instead of reading them, so every worker process of a machine shares the same physical pages of the model.
+With --with-model a copy of the sklearn model (model.joblib) is saved with them, for APIs that opt in
+to predicting batches over GETAROUND_COMPILED_MAX_ROWS rows with sklearn.
+"""
+# imports
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+
+# rows walked through the trees at once, bounds the (estimators x rows) working arrays,
+# small enough for the working arrays to stay in cache
+CHUNK_ROWS = 1024
+# share of the active entries that must have reached a leaf before they are compacted
+COMPACT_SHARE = 0.25
+
+
+class CompiledEnsemble:
+    """
+    Bagging ensemble of decision trees, or of linear models, stored as flat arrays.
+
+    Trees: feature, threshold and value have one entry per node, roots holds the first node of each tree,
+    and the children of node n are children[2n] (left) and children[2n + 1] (right).
+    Leaves are the nodes whose children are themselves, they are flagged in is_leaf.
+    Linear models: coef_features holds the columns selected for each estimator, a (n_estimators, n_selected)
+    matrix that may repeat a column, coef their coefficients with the same shape, and intercept a (n_estimators,) vector.
+    """
+
+    # arrays saved by save, one .npy file each
+    ARRAYS = ["roots", "feature", "threshold", "children", "is_leaf", "value", "coef_features", "coef", "intercept"]
+
+    def __init__(self, n_features, roots=None, feature=None, threshold=None, children=None, is_leaf=None,
+                 value=None, max_depth=0, coef_features=None, coef=None, intercept=None):
+        self.n_features = int(n_features)
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.is_leaf = is_leaf
+        self.value = value
+        self.max_depth = int(max_depth)
+        self.coef_features = coef_features
+        self.coef = coef
+        self.intercept = intercept
+
+    @property
+    def kind(self):
+        return "linear" if self.coef is not None else "trees"
+
+    @property
+    def n_estimators(self):
+        return len(self.intercept) if self.kind == "linear" else len(self.roots)
+
+    @classmethod
+    def from_bagging(cls, model):
+        """
+        Flatten a fitted BaggingRegressor whose estimators are decision trees or linear models.
+        """
+        n_features = model.n_features_in_
+        if all(hasattr(estimator, "tree_") for estimator in model.estimators_):
+            return cls._from_trees(model, n_features)
+        if all(hasattr(estimator, "coef_") for estimator in model.estimators_):
+            return cls._from_linear(model, n_features)
+        raise TypeError("only bagging ensembles of decision trees or linear models can be compiled")
+
+    @classmethod
+    def _from_trees(cls, model, n_features):
+        roots, feature, threshold, children, is_leaf, value = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator, features in zip(model.estimators_, model.estimators_features_):
+            tree = estimator.tree_
+            if tree.n_outputs != 1:
+                raise TypeError("only single output trees can be compiled")
+            nodes = np.arange(tree.node_count)
+            leaf = tree.children_left == -1
+
+            # tree features index the columns selected for this estimator
+            feature.append(np.where(leaf, 0, np.asarray(features)[np.maximum(tree.feature, 0)]))
+            threshold.append(np.where(leaf, np.inf, tree.threshold))
+            left = np.where(leaf, nodes, tree.children_left) + offset
+            right = np.where(leaf, nodes, tree.children_right) + offset
+            children.append(np.stack([left, right], axis=1).ravel())
+            is_leaf.append(leaf)
+            value.append(tree.value[:, 0, 0])
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            n_features,
+            roots=np.asarray(roots, dtype=np.int32),
+            feature=np.concatenate(feature).astype(np.int32),
+            threshold=np.concatenate(threshold).astype(np.float64),
+            children=np.concatenate(children).astype(np.int32),
+            is_leaf=np.concatenate(is_leaf),
+            value=np.concatenate(value).astype(np.float64),
+            max_depth=max_depth,
+        )
+
+    @classmethod
+    def _from_linear(cls, model, n_features):
+        for estimator in model.estimators_:
+            if np.ndim(estimator.coef_) != 1:
+                raise TypeError("only single output linear models can be compiled")
+        return cls(
+            n_features,
+            coef_features=np.stack([np.asarray(features) for features in model.estimators_features_]).astype(np.int32),
+            coef=np.stack([estimator.coef_ for estimator in model.estimators_]).astype(np.float64),
+            intercept=np.array([estimator.intercept_ for estimator in model.estimators_], dtype=np.float64),
+        )
+
+    def _predict_linear(self, X):
+        # one product per estimator over its own columns, the same operations as sklearn so that rounding is identical
+        return np.stack([X[:, features] @ coef + intercept
+                         for features, coef, intercept in zip(self.coef_features, self.coef, self.intercept)])
+
+    def _predict_trees(self, X):
+        # trees compare float32 features to float64 thresholds, like sklearn does
+        X = X.astype(np.float32)
+        n_rows = len(X)
+        X = X.ravel()
+
+        # one entry per (estimator, row), all starting at the root of their tree
+        nodes = np.repeat(self.roots, n_rows)
+        row_offset = np.tile(np.arange(n_rows, dtype=np.int32) * self.n_features, len(self.roots))
+
+        # go down one level of every tree at a time, for the entries that were not on a leaf at the last compaction:
+        # a leaf is its own child, so entries on a leaf stay there, and the active entries are only compacted
+        # once enough of them reached a leaf, compacting at every level costs more than the steps it saves
+        active = np.arange(len(nodes), dtype=np.int32)
+        current = nodes
+        offset = row_offset
+        while len(active):
+            go_right = X.take(offset + self.feature.take(current)) > self.threshold.take(current)
+            current = self.children.take(2 * current + go_right)
+            leaf = self.is_leaf.take(current)
+            if np.count_nonzero(leaf) > COMPACT_SHARE * len(active):
+                nodes[active] = current
+                keep = ~leaf
+                active, current, offset = active[keep], current[keep], offset[keep]
+        return self.value.take(nodes).reshape(len(self.roots), n_rows)
+
+    def predict_all(self, X):
+        """
+        Predictions of every estimator, as a (n_estimators, n_rows) array.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X should have shape (n_rows, {self.n_features}), got {X.shape}")
+        if self.kind == "linear":
+            return self._predict_linear(X)
+        return np.concatenate([
+            self._predict_trees(X[start:start + CHUNK_ROWS]) for start in range(0, len(X), CHUNK_ROWS)
+        ], axis=1) if len(X) else np.empty((self.n_estimators, 0))
+
+    def _mean(self, predictions):
+        # add estimators one after the other, in the same order as sklearn, so that rounding is identical
+        total = np.zeros(predictions.shape[1])
+        for row in predictions:
+            total += row
+        return total / self.n_estimators
+
+    def predict(self, X):
+        """
+        Average of the estimators, same as BaggingRegressor.predict.
+        """
+        return self._mean(self.predict_all(X))
+
+    def predict_spread(self, X, quantiles=()):
+        """
+        Average of the estimators, with their standard deviation and quantiles, from a single pass over the trees.
+
+        Returns the mean and std, (n_rows,) arrays, and the quantiles as a (len(quantiles), n_rows) array.
+        The mean is identical to predict.
+        """
+        predictions = self.predict_all(X)
+        return (self._mean(predictions), predictions.std(axis=0),
+                np.quantile(predictions, quantiles, axis=0).reshape(len(quantiles), predictions.shape[1]))
+
+    def save(self, path):
+        """
+        Save the arrays to a directory, one .npy file per array plus meta.json for the sizes.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            if array is not None:
+                np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"n_features": self.n_features, "max_depth": self.max_depth}, f)
+
+    @classmethod
+    def files(cls, path):
+        """
+        Files of a saved ensemble, meta.json first.
+        """
+        names = ["meta.json"] + [f"{name}.npy" for name in cls.ARRAYS]
+        return [os.path.join(path, name) for name in names if os.path.exists(os.path.join(path, name))]
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """
+        Load a saved ensemble, by default memory mapping the arrays read-only.
+        """
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = {}
+        for name in cls.ARRAYS:
+            file = os.path.join(path, f"{name}.npy")
+            if os.path.exists(file):
+                arrays[name] = np.load(file, mmap_mode=mmap_mode)
+        return cls(**meta, **arrays)
+
+
+def main():
+    import joblib
+    import config
+    from registry import MODEL_FILE, ModelRegistry, build_preprocessor, load_training_features
+
+    parser = argparse.ArgumentParser(description="Export a fitted BaggingRegressor to flat arrays.")
+    parser.add_argument("model", help="joblib file of the fitted model")
+    parser.add_argument("--data", default=config.DATA_PATH,
+                        help="training features the preprocessor is fitted on, its encoder is saved with the arrays")
+    parser.add_argument("--output", default="final_model_api_arrays", help="directory to save the arrays in")
+    parser.add_argument("--with-model", action="store_true",
+                        help="also copy the sklearn model, used for large batches when GETAROUND_COMPILED_MAX_ROWS is set")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(build_preprocessor(load_training_features(args.data)), joblib.load(args.model))
+    registry.export(args.output)
+    if args.with_model:
+        shutil.copyfile(args.model, os.path.join(args.output, MODEL_FILE))
+    print(f"{registry.compiled.n_estimators} {registry.compiled.kind} estimators and their encoder saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# settings shared by the API modules
+# every value can be overridden with an environment variable, defaults match the Docker image layout
+import os
+
+# training features used to fit the preprocessor, their Parquet version (see ingest.py) when it exists,
+# and the trained model
+DATA_PATH = os.environ.get(
+    "GETAROUND_DATA_PATH",
+    "Data/preprocessed_X.parquet" if os.path.exists("Data/preprocessed_X.parquet") else "Data/preprocessed_X.csv"
+)
+MODEL_PATH = os.environ.get("GETAROUND_MODEL_PATH", "final_model_api")
+# model exported by compiled.py, or a bundle written by train.py,
+# memory mapped and used instead of MODEL_PATH when the directory exists
+COMPILED_PATH = os.environ.get("GETAROUND_COMPILED_PATH", "final_model_api_arrays")
+
+# maximum number of cars accepted by /batch_predict in a single request
+BATCH_MAX_ROWS = int(os.environ.get("GETAROUND_BATCH_MAX_ROWS", 5000))
+
+# maximum number of combinations scored by one /price_grid request
+GRID_MAX_SIZE = int(os.environ.get("GETAROUND_GRID_MAX_SIZE", 10000))
+
+# number of rows scored at once by /stream_predict and bulk.py, peak memory grows with it
+STREAM_CHUNK_ROWS = int(os.environ.get("GETAROUND_STREAM_CHUNK_ROWS", 1000))
+
+# /stream_predict bodies larger than this are spooled to disk instead of memory
+STREAM_SPOOL_BYTES = int(os.environ.get("GETAROUND_STREAM_SPOOL_BYTES", 8 * 1024 * 1024))
+
+# /predict cache: maximum number of cars (0 disables it), seconds before an entry expires (0 never),
+# and mileage bucket size, cars in the same bucket share a price (0 uses the exact mileage)
+CACHE_SIZE = int(os.environ.get("GETAROUND_CACHE_SIZE", 10000))
+CACHE_TTL = float(os.environ.get("GETAROUND_CACHE_TTL", 0))
+CACHE_MILEAGE_BUCKET = int(os.environ.get("GETAROUND_CACHE_MILEAGE_BUCKET", 0))
+
+# concurrent /predict calls wait up to this many milliseconds, or until this many cars are waiting,
+# to be predicted together in one call (0 predicts every call on its own)
+MICROBATCH_DELAY = float(os.environ.get("GETAROUND_MICROBATCH_DELAY_MS", 2)) / 1000
+MICROBATCH_MAX_ROWS = int(os.environ.get("GETAROUND_MICROBATCH_MAX_ROWS", 64))
+
+# every batch is predicted with the flattened ensemble (compiled.py) by default, opt in to predict batches
+# over this many rows with sklearn instead: when serving an export, the first large batch then loads model.joblib,
+# and sklearn, pandas and scipy, into the worker (about 200 MB of private memory); 0 keeps the arrays for every batch
+COMPILED_MAX_ROWS = int(os.environ.get("GETAROUND_COMPILED_MAX_ROWS", 0))
+
+# inference backend for batches: "local" (calling thread) or "process" (pool of worker processes),
+# number of worker processes (0 uses every core), and minimum number of rows sent to a worker
+INFERENCE_BACKEND = os.environ.get("GETAROUND_INFERENCE_BACKEND", "local")
+INFERENCE_WORKERS = int(os.environ.get("GETAROUND_INFERENCE_WORKERS", 0))
+INFERENCE_MIN_ROWS = int(os.environ.get("GETAROUND_INFERENCE_MIN_ROWS", 500))
+
+# when enabled, a request sent with the header "X-Profile: 1" returns a sampling profile of itself instead of its response
+PROFILING = os.environ.get("GETAROUND_PROFILING", "0") == "1"
+PROFILING_INTERVAL = float(os.environ.get("GETAROUND_PROFILING_INTERVAL", 0.001))
+
+# directory of model bundles written by train.py, watched every MODEL_WATCH_INTERVAL seconds:
+# its newest bundle is loaded in the background and replaces the served model (empty disables the watcher)
+MODEL_WATCH_PATH = os.environ.get("GETAROUND_MODEL_WATCH_PATH", "")
+MODEL_WATCH_INTERVAL = float(os.environ.get("GETAROUND_MODEL_WATCH_INTERVAL", 10))
+
+# token expected in the X-Admin-Token header of the admin endpoints, they are disabled when it is empty
+ADMIN_TOKEN = os.environ.get("GETAROUND_ADMIN_TOKEN", "")
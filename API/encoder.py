@@ -0,0 +1,137 @@
+# imports
+import json
+import numpy as np
+
+
+class FeatureEncoder:
+    """
+    Lightweight copy of the fitted preprocessor.
+
+    The ColumnTransformer standardizes the numerical columns and one hot encodes the categorical ones.
+    With so few columns, building a one row DataFrame and going through sklearn costs more than the model itself,
+    so the encoder keeps the scaler mean/scale and a category -> column lookup, and writes the features
+    straight into a NumPy row. Results are identical to preprocessor.transform.
+    """
+
+    def __init__(self, numerical_features, mean, scale, categorical_features, category_columns, n_columns):
+        self.numerical_features = list(numerical_features)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.categorical_features = list(categorical_features)
+        # one dictionary per categorical feature: {category: output column}, -1 for the dropped category
+        self.category_columns = category_columns
+        self.n_columns = n_columns
+
+    @classmethod
+    def from_preprocessor(cls, preprocessor):
+        """
+        Extract the encoder from the fitted ColumnTransformer built by registry.build_preprocessor.
+        """
+        scaler = preprocessor.named_transformers_["numerical"].named_steps["standardization"]
+        one_hot = preprocessor.named_transformers_["categorical"].named_steps["one hot encoding"]
+        numerical_features = preprocessor.transformers_[0][2]
+        categorical_features = preprocessor.transformers_[1][2]
+
+        # one hot columns come after the numerical ones, in the order of the categories
+        # the dropped category of each feature has no column
+        category_columns = []
+        column = len(numerical_features)
+        for i, categories in enumerate(one_hot.categories_):
+            dropped = None if one_hot.drop_idx_ is None else one_hot.drop_idx_[i]
+            columns = {}
+            for j, category in enumerate(categories):
+                if dropped is not None and j == dropped:
+                    columns[category] = -1
+                else:
+                    columns[category] = column
+                    column += 1
+            category_columns.append(columns)
+
+        return cls(numerical_features, scaler.mean_, scaler.scale_, categorical_features, category_columns, column)
+
+    def save(self, path):
+        """
+        Save the encoder to a json file, floats are written with enough digits to be read back exactly.
+        """
+        with open(path, "w") as f:
+            json.dump({
+                "numerical_features": self.numerical_features,
+                "mean": self.mean.tolist(),
+                "scale": self.scale.tolist(),
+                "categorical_features": self.categorical_features,
+                "category_columns": self.category_columns,
+                "n_columns": self.n_columns,
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    @property
+    def feature_names(self):
+        return self.numerical_features + self.categorical_features
+
+    def _column(self, feature, lookup, value):
+        try:
+            return lookup[value]
+        except (KeyError, TypeError):
+            raise ValueError(f"unknown {feature}: {value!r}, options are {list(lookup)}") from None
+
+    def encode(self, features, out=None):
+        """
+        Encode a dictionary of features into a (1, n_columns) array, same as preprocessor.transform on one row.
+
+        out can be a preallocated array of that shape, it is overwritten and returned.
+        """
+        row = np.empty((1, self.n_columns), dtype=np.float64) if out is None else out
+        row.fill(0.0)
+
+        n_numerical = len(self.numerical_features)
+        values = row[0, :n_numerical]
+        values[:] = [features[col] for col in self.numerical_features]
+        values -= self.mean
+        values /= self.scale
+
+        for col, lookup in zip(self.categorical_features, self.category_columns):
+            column = self._column(col, lookup, features[col])
+            if column >= 0:
+                row[0, column] = 1.0
+        return row
+
+    def set_feature(self, X, feature, values):
+        """
+        Overwrite one feature in every row of an encoded matrix, values has one value per row.
+
+        Gives the same columns as encoding each row with that feature changed.
+        """
+        if feature in self.numerical_features:
+            i = self.numerical_features.index(feature)
+            X[:, i] = (np.asarray(values, dtype=np.float64) - self.mean[i]) / self.scale[i]
+        elif feature in self.categorical_features:
+            lookup = self.category_columns[self.categorical_features.index(feature)]
+            columns = np.array([self._column(feature, lookup, value) for value in values], dtype=np.intp)
+            X[:, [column for column in lookup.values() if column >= 0]] = 0.0
+            hot = columns >= 0
+            X[np.flatnonzero(hot), columns[hot]] = 1.0
+        else:
+            raise ValueError(f"unknown feature {feature!r}, options are {self.feature_names}")
+        return X
+
+    def transform(self, df):
+        """
+        Encode every row of a DataFrame, same as preprocessor.transform.
+        """
+        n_numerical = len(self.numerical_features)
+        X = np.zeros((len(df), self.n_columns), dtype=np.float64)
+        X[:, :n_numerical] = df[self.numerical_features].to_numpy(dtype=np.float64)
+        X[:, :n_numerical] -= self.mean
+        X[:, :n_numerical] /= self.scale
+
+        rows = np.arange(len(df))
+        for col, lookup in zip(self.categorical_features, self.category_columns):
+            values = df[col].to_numpy()
+            columns = np.array([self._column(col, lookup, value) for value in values], dtype=np.intp)
+            hot = columns >= 0
+            X[rows[hot], columns[hot]] = 1.0
+        return X
@@ -0,0 +1,131 @@
+"""
+Backends running the model on encoded feature matrices.
+
+- local: predict in the calling thread, the default.
+- process: split large batches across a pool of worker processes, so scoring uses every core instead of
+  being bound to one by the GIL. Workers are forked once at startup and share the loaded model with the API
+  process copy-on-write; without fork (e.g. macOS, Windows) each worker receives a pickled copy instead.
+  Pools created after startup, by a model reload, never fork: the API then has threads that may hold a lock
+  (e.g. of a metric) at the moment of the fork, and the worker would wait on it forever.
+"""
+# imports
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import config
+from metrics import timed
+
+# registry of a worker process, set once by _init_worker
+_worker_registry = None
+
+
+def _init_worker(registry):
+    global _worker_registry
+    _worker_registry = registry
+
+
+def _predict_chunk(X):
+    return _worker_registry.predict_matrix(X)
+
+
+def _predict_spread_chunk(X, quantiles):
+    return _worker_registry.predict_spread(X, quantiles)
+
+
+def _ready(_):
+    return os.getpid()
+
+
+class LocalBackend:
+    """
+    Predict in the calling thread.
+    """
+
+    name = "local"
+    workers = 1
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def predict(self, X):
+        return self.registry.predict_matrix(X)
+
+    def predict_spread(self, X, quantiles=()):
+        return self.registry.predict_spread(X, quantiles)
+
+    def close(self):
+        pass
+
+
+class ProcessPoolBackend(LocalBackend):
+    """
+    Split batches across worker processes and merge their predictions, in order.
+
+    Batches smaller than 2 * min_rows are predicted locally, sending them to a worker costs more than it saves.
+    """
+
+    name = "process"
+
+    def __init__(self, registry, workers=None, min_rows=config.INFERENCE_MIN_ROWS, start_method="fork"):
+        super().__init__(registry)
+        self.workers = workers or os.cpu_count() or 1
+        self.min_rows = min_rows
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(start_method if start_method in methods else None)
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=context,
+                                        initializer=_init_worker, initargs=(registry,))
+        self.closed = False
+        # start every worker now, while the API is starting, instead of on the first batch
+        list(self.pool.map(_ready, range(self.workers)))
+
+    def predict(self, X):
+        n_parts = min(self.workers, math.floor(len(X) / self.min_rows))
+        # a backend replaced by a model reload is closed while requests may still be using it,
+        # they finish in the calling thread with the same registry
+        if n_parts < 2 or self.closed:
+            return super().predict(X)
+        # stages timed inside the workers are not visible from here, time the whole pool instead
+        try:
+            with timed("predict_pool"):
+                return np.concatenate(list(self.pool.map(_predict_chunk, np.array_split(X, n_parts))))
+        except RuntimeError:
+            if not self.closed:
+                raise
+            return super().predict(X)
+
+    def predict_spread(self, X, quantiles=()):
+        n_parts = min(self.workers, math.floor(len(X) / self.min_rows))
+        if n_parts < 2 or self.closed:
+            return super().predict_spread(X, quantiles)
+        try:
+            with timed("predict_pool"):
+                parts = list(self.pool.map(_predict_spread_chunk, np.array_split(X, n_parts), [quantiles] * n_parts))
+        except RuntimeError:
+            if not self.closed:
+                raise
+            return super().predict_spread(X, quantiles)
+        mean, std, values = zip(*parts)
+        return np.concatenate(mean), np.concatenate(std), np.concatenate(values, axis=1)
+
+    def close(self):
+        self.closed = True
+        self.pool.shutdown()
+
+
+BACKENDS = [LocalBackend.name, ProcessPoolBackend.name]
+
+
+def create_backend(registry, name=config.INFERENCE_BACKEND, workers=None, start_method="fork"):
+    """
+    Create the backend called name, workers and start_method are only used by the process backend.
+
+    fork is only safe while the process has a single thread, at startup: use forkserver (or spawn) afterwards.
+    """
+    if name == LocalBackend.name:
+        return LocalBackend(registry)
+    if name == ProcessPoolBackend.name:
+        return ProcessPoolBackend(registry, workers, start_method=start_method)
+    raise ValueError(f"unknown inference backend {name!r}, options are {BACKENDS}")
@@ -0,0 +1,31 @@
+"""
+Convert the training features written by the notebook to a typed Parquet file.
+
+    python ingest.py
+    python ingest.py Data/preprocessed_X.csv --output Data/preprocessed_X.parquet
+
+The API reads the Parquet file instead of the CSV when it exists: it is faster to read,
+and keeps the categorical columns and integer types, so nothing has to be converted at startup.
+"""
+# imports
+import argparse
+import os
+
+from registry import load_training_features
+
+CSV_PATH = "Data/preprocessed_X.csv"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the training features CSV to Parquet.")
+    parser.add_argument("csv", nargs="?", default=CSV_PATH)
+    parser.add_argument("--output", default=os.path.splitext(CSV_PATH)[0] + ".parquet")
+    args = parser.parse_args()
+
+    X = load_training_features(args.csv)
+    X.to_parquet(args.output, index=False)
+    print(f"{args.output}: {len(X)} rows, columns: {dict(X.dtypes.astype(str))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Prometheus metrics of the API, exposed in the text format on /metrics.
+
+Small in-process counters, gauges and histograms, so that no client library is needed.
+Stages of the prediction path are timed with:
+
+    with timed("transform"):
+        ...
+"""
+# imports
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# histogram buckets, in seconds for durations
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Metric:
+
+    kind = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+
+    kind = "counter"
+
+    def inc(self, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self):
+        with self._lock:
+            return self.header() + [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """
+    Gauge set directly, or read from a function at every scrape.
+
+    The function returns a dictionary {labels tuple: value}, labels being ((name, value), ...).
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, function=None):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        if self.function is not None:
+            values.update(self.function())
+        return self.header() + [f"{self.name}{_format_labels(key)} {value}" for key, value in values.items()]
+
+
+class Histogram(Metric):
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+# every metric, in the order they are rendered
+METRICS = []
+
+REQUESTS = Counter("getaround_requests_total", "HTTP requests by endpoint, method and status code.")
+REQUEST_SECONDS = Histogram("getaround_request_duration_seconds", "HTTP request duration by endpoint.")
+STAGE_SECONDS = Histogram("getaround_stage_duration_seconds", "Duration of each stage of loading and prediction.")
+BATCH_SIZE = Histogram("getaround_batch_size", "Cars per batch, by endpoint.", SIZE_BUCKETS)
+MICROBATCH_SIZE = Histogram("getaround_microbatch_size", "Single car predictions batched together by /predict.",
+                            SIZE_BUCKETS)
+MICROBATCH_WAIT_SECONDS = Histogram("getaround_microbatch_wait_seconds",
+                                    "Time a /predict call waits for its batch to be predicted.")
+# read from the app at every scrape, see app.py
+MODEL_INFO = Gauge("getaround_model_info", "Version of the model being served.")
+RELOADS = Counter("getaround_model_reloads_total", "Model reloads, by result.")
+CACHE = Gauge("getaround_cache", "Prediction cache hits, misses, hit rate, evictions and size, by stat.")
+
+
+@contextmanager
+def timed(stage):
+    """
+    Record the duration of the with block as a stage.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,54 @@
+"""
+Sampling profiler for diagnosing slow requests.
+
+While running, a background thread records the Python stack of every other thread each interval.
+Only stacks that go through the API's own modules are kept, so idle server threads are left out.
+The report is in the collapsed stack format ("frame;frame;frame count"), which flame graph tools
+such as flamegraph.pl or speedscope read directly. Samples of concurrent requests are mixed together.
+"""
+# imports
+import os
+import sys
+import threading
+from collections import Counter
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class SamplingProfiler:
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                ours = False
+                while frame is not None:
+                    code = frame.f_code
+                    ours = ours or code.co_filename.startswith(API_DIR)
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                if ours:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self):
+        total = sum(self.samples.values())
+        lines = [f"# {total} samples every {self.interval * 1000:g} ms"]
+        lines += [f"{stack} {count}" for stack, count in self.samples.most_common()]
+        return "\n".join(lines) + "\n"
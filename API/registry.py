@@ -0,0 +1,258 @@
+# imports
+# pandas, joblib and sklearn are only needed to fit the preprocessor and load the sklearn model,
+# they are imported when used so that serving the exported model (see compiled.py) only loads NumPy
+import hashlib
+import os
+import threading
+import numpy as np
+
+import config
+from compiled import CompiledEnsemble
+from encoder import FeatureEncoder
+from metrics import timed
+
+# columns that are read as objects and have to be one hot encoded
+CATEGORICAL_COLUMNS = ["model_key", "fuel", "paint_color", "car_type"]
+
+# encoder saved next to the arrays of the exported model
+ENCODER_FILE = "encoder.json"
+# sklearn model saved next to the arrays, loaded on the first batch over config.COMPILED_MAX_ROWS rows, when set
+MODEL_FILE = "model.joblib"
+
+# held while the sklearn model of an exported registry is loaded, so that concurrent batches load it once
+_model_lock = threading.Lock()
+
+
+def load_training_features(path=config.DATA_PATH):
+    """
+    Read the preprocessed pricing dataset written by the notebook, or its Parquet version written by ingest.py.
+    """
+    import pandas as pd
+
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+
+    X = pd.read_csv(path)
+    X.drop(columns="Unnamed: 0", inplace=True)
+
+    # change objects to categories
+    for col in CATEGORICAL_COLUMNS:
+        X[col] = X[col].astype("category")
+    return X
+
+
+def build_preprocessor(X):
+    """
+    Create and fit the preprocessor used by the model, same steps as in the notebook.
+    """
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.compose import ColumnTransformer
+
+    cat_features = []
+    num_features = []
+
+    for col_name, col_type in X.dtypes.items():
+        if ((col_type=="category")):
+            cat_features.append(col_name)
+        elif col_type==np.int64:
+            num_features.append(col_name)
+
+    num_transformer = Pipeline(steps=[
+        ("standardization", StandardScaler())
+    ])
+
+    cat_transformer = Pipeline(steps=[
+        ("one hot encoding", OneHotEncoder(drop="first"))
+    ])
+
+    # parameters: name, transformer, columns to be applied on
+    preprocessor = ColumnTransformer(transformers=[
+        ("numerical", num_transformer, num_features),
+        ("categorical", cat_transformer, cat_features)
+    ])
+
+    preprocessor.fit(X)
+    return preprocessor
+
+
+def artifact_version(*paths):
+    """
+    Short hash of the content of the files a model is built from, it changes whenever one of them changes.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+class ModelRegistry:
+    """
+    Fitted preprocessor and model, built once when the API starts.
+
+    Requests only read from the registry, so a single instance is shared by every request of a worker.
+    When the model was exported with compiled.py, the registry only holds the encoder and the flattened ensemble,
+    and preprocessor and model are None. The sklearn model saved with the export, model_path, is then only loaded
+    for the first batch over config.COMPILED_MAX_ROWS rows, when it is set.
+    """
+
+    def __init__(self, preprocessor, model, version=None, compiled=None, encoder=None, model_path=None):
+        self.preprocessor = preprocessor
+        self.model = model
+        self.model_path = model_path
+        self.version = version
+        # requests are encoded with the lightweight encoder instead of preprocessor.transform
+        self.encoder = FeatureEncoder.from_preprocessor(preprocessor) if encoder is None else encoder
+        # and predicted with the flattened ensemble, when the model can be flattened
+        if compiled is None and model is not None:
+            try:
+                with timed("compile_model"):
+                    compiled = CompiledEnsemble.from_bagging(model)
+            except (TypeError, AttributeError):
+                compiled = None
+        self.compiled = compiled
+
+    @classmethod
+    def from_files(cls, data_path=config.DATA_PATH, model_path=config.MODEL_PATH, compiled_path=config.COMPILED_PATH):
+        """
+        Build the registry from the training features and the model.
+
+        When the model was exported with compiled.py to compiled_path, the encoder is read from it
+        and the arrays are memory mapped, so that every worker shares the same memory: neither the training
+        features nor the sklearn model are read at startup, and pandas and sklearn are not imported.
+        """
+        encoder_path = os.path.join(compiled_path, ENCODER_FILE) if compiled_path else ""
+        if os.path.exists(encoder_path):
+            with timed("load_model"):
+                encoder = FeatureEncoder.load(encoder_path)
+                compiled = CompiledEnsemble.load(compiled_path, mmap_mode="r")
+            version = artifact_version(encoder_path, *CompiledEnsemble.files(compiled_path))
+            model_file = os.path.join(compiled_path, MODEL_FILE)
+            return cls(None, None, version, compiled=compiled, encoder=encoder,
+                       model_path=model_file if os.path.exists(model_file) else None)
+
+        with timed("read_training_data"):
+            X = load_training_features(data_path)
+        with timed("fit_preprocessor"):
+            preprocessor = build_preprocessor(X)
+        # arrays exported without their encoder
+        if compiled_path and os.path.isdir(compiled_path):
+            with timed("load_model"):
+                compiled = CompiledEnsemble.load(compiled_path, mmap_mode="r")
+            version = artifact_version(data_path, *CompiledEnsemble.files(compiled_path))
+            return cls(preprocessor, None, version, compiled=compiled)
+
+        import joblib
+
+        with timed("load_model"):
+            model = joblib.load(model_path)
+        return cls(preprocessor, model, artifact_version(data_path, model_path))
+
+    def export(self, path):
+        """
+        Save the encoder and the flattened ensemble to a directory, from_files then serves them with NumPy only.
+        """
+        self.compiled.save(path)
+        self.encoder.save(os.path.join(path, ENCODER_FILE))
+
+    def sklearn_model(self):
+        """
+        The sklearn model, loaded from model_path on first use when the registry was built from an export.
+        None when there is no sklearn model.
+        """
+        if self.model is None and self.model_path is not None:
+            with _model_lock:
+                if self.model is None:
+                    import joblib
+
+                    with timed("load_model"):
+                        self.model = joblib.load(self.model_path)
+        return self.model
+
+    @property
+    def feature_names(self):
+        """
+        Columns of a request, numerical features first.
+        """
+        return self.encoder.feature_names
+
+    @property
+    def numerical_features(self):
+        return self.encoder.numerical_features
+
+    @property
+    def categorical_features(self):
+        return self.encoder.categorical_features
+
+    def row_errors(self, df):
+        """
+        Find rows with a category the preprocessor was not fitted on.
+
+        Returns a dictionary {row position: error message}, rows without errors are not included.
+        """
+        errors = {}
+        for col, lookup in zip(self.categorical_features, self.encoder.category_columns):
+            unknown = ~df[col].isin(list(lookup)).to_numpy()
+            for row in np.flatnonzero(unknown):
+                errors.setdefault(int(row), f"unknown {col}: {df[col].iloc[row]!r}, options are {list(lookup)}")
+        return errors
+
+    def encode_records(self, records):
+        """
+        Encode a list of feature dictionaries, without building a dataframe.
+
+        Returns the encoded rows that could be encoded, their positions in records,
+        and a dictionary {row position: error message} for the others.
+        """
+        X = np.empty((len(records), self.encoder.n_columns))
+        errors = {}
+        with timed("transform"):
+            for row, features in enumerate(records):
+                try:
+                    self.encoder.encode(features, out=X[row:row + 1])
+                except ValueError as e:
+                    errors[row] = str(e)
+        valid_rows = [row for row in range(len(records)) if row not in errors]
+        return X[valid_rows], valid_rows, errors
+
+    def transform(self, df):
+        with timed("transform"):
+            return self.encoder.transform(df)
+
+    def predict_matrix(self, X):
+        """
+        Predict the price of every row of an encoded feature matrix.
+
+        Both give identical results. The flattened ensemble is used for every batch, unless config.COMPILED_MAX_ROWS
+        is set: larger batches then use the sklearn model, when there is one.
+        """
+        with timed("predict"):
+            use_sklearn = config.COMPILED_MAX_ROWS and len(X) > config.COMPILED_MAX_ROWS
+            if self.compiled is not None and (not use_sklearn or self.sklearn_model() is None):
+                return self.compiled.predict(X)
+            return self.model.predict(X)
+
+    def predict_spread(self, X, quantiles=()):
+        """
+        Predict the price of every row of an encoded feature matrix, with the standard deviation
+        and quantiles of the prices predicted by the estimators of the ensemble.
+
+        Returns mean, std and quantiles as in CompiledEnsemble.predict_spread.
+        """
+        with timed("predict_spread"):
+            if self.compiled is not None:
+                return self.compiled.predict_spread(X, quantiles)
+            # ensemble that could not be flattened, one call per estimator
+            predictions = np.stack([estimator.predict(X[:, features]) for estimator, features
+                                    in zip(self.model.estimators_, self.model.estimators_features_)])
+            return (self.model.predict(X), predictions.std(axis=0),
+                    np.quantile(predictions, quantiles, axis=0).reshape(len(quantiles), predictions.shape[1]))
+
+    def predict(self, df):
+        """
+        Predict the price of every row of a dataframe with the request features.
+        """
+        return self.predict_matrix(self.transform(df))
@@ -0,0 +1,118 @@
+"""
+Replace the served model without restarting the API.
+
+A new model is loaded and warmed up in the background, then swapped in with a single assignment
+of app.state.registry and app.state.backend. Requests read them once when they start,
+so requests in flight finish on the old model while new ones use the new model.
+
+Reloads are triggered by the watcher, when a new bundle appears in config.MODEL_WATCH_PATH,
+or by the /admin/reload endpoint.
+"""
+# imports
+import asyncio
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+import config
+import metrics
+from inference import create_backend
+from registry import ENCODER_FILE, ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+# rows predicted by a new model before it is swapped in
+WARMUP_ROWS = 64
+
+
+def latest_bundle(path):
+    """
+    Most recently written bundle of a directory of bundles, None when there is none.
+    """
+    try:
+        entries = list(os.scandir(path))
+    except FileNotFoundError:
+        return None
+    # bundles being written by train.py are hidden until they are complete
+    bundles = [entry for entry in entries if entry.is_dir() and not entry.name.startswith(".")
+               and os.path.exists(os.path.join(entry.path, ENCODER_FILE))]
+    if not bundles:
+        return None
+    return max(bundles, key=lambda entry: entry.stat().st_mtime).path
+
+
+class ModelReloader:
+    """
+    Load, warm up and swap in the model of the API.
+    """
+
+    def __init__(self, app, watch_path=config.MODEL_WATCH_PATH, interval=config.MODEL_WATCH_INTERVAL):
+        self.app = app
+        self.watch_path = watch_path
+        self.interval = interval
+        # path of the served bundle, None for the model loaded at startup
+        self.path = None
+        self.lock = threading.Lock()
+
+    def reload(self, path=None):
+        """
+        Load the bundle at path, by default the newest one of the watched directory, and swap it in.
+
+        Runs in the calling thread, returns a dictionary with the previous and new versions.
+        Raises ValueError when there is no bundle to load.
+        """
+        path = path or (latest_bundle(self.watch_path) if self.watch_path else None)
+        if not path or not os.path.exists(os.path.join(path, ENCODER_FILE)):
+            raise ValueError(f"no model bundle at {path!r}")
+
+        # one reload at a time, a second one waits for the first and then loads its own bundle
+        with self.lock:
+            start = time.perf_counter()
+            try:
+                with metrics.timed("reload"):
+                    registry = ModelRegistry.from_files(compiled_path=path)
+                    # the API is serving requests from several threads, workers must not be forked from it
+                    backend = create_backend(registry, workers=config.INFERENCE_WORKERS, start_method="forkserver")
+                    # run the new model once, so that the first requests do not pay for it
+                    backend.predict(np.zeros((WARMUP_ROWS, registry.encoder.n_columns)))
+            except Exception:
+                metrics.RELOADS.inc(result="error")
+                raise
+            metrics.RELOADS.inc(result="ok")
+
+            previous = self.app.state.backend
+            self.app.state.registry = registry
+            self.app.state.backend = backend
+            self.path = path
+
+        # requests still using the old backend fall back to predicting in their own thread
+        previous.close()
+        logger.info("model %s loaded from %s, replacing %s", registry.version, path, previous.registry.version)
+        return {
+            "version": registry.version,
+            "previous version": previous.registry.version,
+            "path": path,
+            "seconds": time.perf_counter() - start,
+        }
+
+    async def watch(self):
+        """
+        Reload whenever a new bundle appears in the watched directory, until cancelled.
+
+        Only bundles newer than the last one seen are loaded, a bundle chosen with /admin/reload is kept
+        until the next one is written, and a bundle that cannot be loaded is not retried.
+        """
+        seen = latest_bundle(self.watch_path)
+        while True:
+            await asyncio.sleep(self.interval)
+            path = latest_bundle(self.watch_path)
+            if path is None or path == seen:
+                continue
+            seen = path
+            try:
+                await asyncio.to_thread(self.reload, path)
+            except Exception:
+                # keep serving the current model
+                logger.exception("could not load the model bundle %s", path)
@@ -0,0 +1,75 @@
+"""
+Price of a car over a grid of values of some of its features, used by the /price_grid endpoint.
+
+The base car is encoded once and copied into one row per combination of the grid values,
+only the columns of the varied features are rewritten, and every row is predicted in a single call.
+"""
+# imports
+import math
+import numpy as np
+
+
+def grid_values(grid, ranges):
+    """
+    Merge the listed values and the ranges into {feature: list of values}, in request order.
+
+    Ranges are dictionaries with start, stop and step, stop is included.
+    They are kept as range objects, so that the size of a huge grid is known before anything is allocated.
+    """
+    values = {}
+    for feature, listed in grid.items():
+        values[feature] = list(listed)
+    for feature, bounds in ranges.items():
+        if feature in values:
+            raise ValueError(f"{feature} is both in grid and in ranges")
+        start, stop, step = bounds["start"], bounds["stop"], bounds["step"]
+        if step <= 0:
+            raise ValueError(f"the step of {feature} must be positive")
+        values[feature] = range(start, stop + 1, step)
+    if not values:
+        raise ValueError("give the values of at least one feature in grid or ranges")
+    for feature, listed in values.items():
+        if not listed:
+            raise ValueError(f"no values for {feature}")
+    return values
+
+
+def grid_size(values):
+    return math.prod(len(listed) for listed in values.values())
+
+
+def price_grid(registry, features, values, predict=None):
+    """
+    Predict the price of the car for every combination of values, {feature: list of values}.
+
+    Returns the varied features, their values, the prices as a nested list with one level per feature,
+    and the combination with the highest price.
+    Raises ValueError for an unknown feature or category, or a non numerical value of a numerical feature.
+    """
+    encoder = registry.encoder
+    for feature, listed in values.items():
+        if feature in encoder.numerical_features and not all(
+                isinstance(value, (int, float)) and not isinstance(value, bool) for value in listed):
+            raise ValueError(f"values of {feature} must be numbers")
+
+    names = list(values)
+    shape = tuple(len(values[feature]) for feature in names)
+    # position of every row in the grid, one row of indices per feature
+    positions = np.indices(shape).reshape(len(shape), -1)
+
+    X = np.repeat(encoder.encode(features), positions.shape[1], axis=0)
+    for feature, indices in zip(names, positions):
+        listed = values[feature]
+        encoder.set_feature(X, feature, [listed[i] for i in indices])
+
+    prices = (registry.predict_matrix if predict is None else predict)(X)
+    best = int(np.argmax(prices))
+    return {
+        "features": names,
+        "values": [list(values[feature]) for feature in names],
+        "optimal price": prices.reshape(shape).tolist(),
+        "best": {
+            "features": {feature: values[feature][indices[best]] for feature, indices in zip(names, positions)},
+            "optimal price": float(prices[best]),
+        },
+    }
@@ -0,0 +1,222 @@
+"""
+Train the pricing model from the raw pricing dataset, with the same steps as Deployment_getaround.ipynb,
+and save everything the API needs into one versioned bundle.
+
+    python train.py
+    python train.py Data/get_around_pricing_project.csv --output bundles --n-jobs -1 --evaluate
+
+The bundle is a directory named after its version, a hash of the exported model, with:
+- preprocessor.joblib and model.joblib: the fitted ColumnTransformer and BaggingRegressor,
+  the API only loads model.joblib for batches over GETAROUND_COMPILED_MAX_ROWS rows, when it is set
+- schema.json: feature order, numerical and categorical features, categories and the rare classes put in "other"
+- metadata.json: version, training parameters, library versions, dataset size, scores and stage timings
+- encoder.json and the flattened ensemble (see compiled.py), served by the API with NumPy only
+
+Serve it with GETAROUND_COMPILED_PATH=bundles/<version>, the training data is never read by the API.
+"""
+# imports
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import joblib
+import sklearn
+from sklearn.ensemble import BaggingRegressor
+from sklearn.metrics import r2_score
+from sklearn.model_selection import train_test_split
+
+from compiled import CompiledEnsemble
+from registry import ENCODER_FILE, MODEL_FILE, ModelRegistry, artifact_version, build_preprocessor
+
+PRICING_PATH = "Data/get_around_pricing_project.csv"
+TARGET = "rental_price_per_day"
+
+# classes with at most this share of the cars are put together in "other"
+OTHER_SHARE = 0.10
+
+# best parameters of the notebook's grid search
+MODEL_PARAMS = {"n_estimators": 100, "max_samples": 0.5, "random_state": 42}
+
+
+@contextmanager
+def stage(timings, name):
+    """
+    Add the duration in seconds of the block to timings[name].
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+def load_pricing(path=PRICING_PATH):
+    """
+    Read the raw pricing dataset, without its repeated index and the cars with a negative mileage.
+    """
+    pricing = pd.read_csv(path)
+    pricing = pricing.drop(columns="Unnamed: 0")
+
+    # change objects to categories
+    for col_name, col_type in pricing.dtypes.items():
+        if col_type == "object" or col_type == "str":
+            pricing[col_name] = pricing[col_name].astype("category")
+
+    return pricing[pricing["mileage"] >= 0]
+
+
+def rare_classes(pricing, share=OTHER_SHARE):
+    """
+    Classes of every categorical column with at most share of the cars, per column.
+    """
+    rare = {}
+    for col_name, col_type in pricing.dtypes.items():
+        if col_type == "category":
+            counts = pricing[col_name].value_counts()
+            rare[col_name] = [str(category) for category, count in counts.items() if count / len(pricing) <= share]
+    return rare
+
+
+def prepare_features(pricing, share=OTHER_SHARE):
+    """
+    Put the rare classes in "other" and turn bools into 0/1, like the notebook before it wrote preprocessed_X.csv.
+
+    Returns the features, the target and the rare classes.
+    """
+    rare = rare_classes(pricing, share)
+    # the notebook replaces every rare class in every categorical column, not only in its own column
+    classes = sorted({category for categories in rare.values() for category in categories})
+
+    X = pricing.drop(columns=TARGET)
+    for col in rare:
+        values = X[col].astype(str)
+        X[col] = values.where(~values.isin(classes), "other").astype("category")
+    for col_name, col_type in X.dtypes.items():
+        if col_type == bool:
+            X[col_name] = X[col_name].astype(np.int64)
+    return X, pricing[TARGET], rare
+
+
+def fit_model(X, y, n_jobs=None, **params):
+    """
+    Fit the preprocessor and the bagging ensemble on the features.
+    """
+    preprocessor = build_preprocessor(X)
+    model = BaggingRegressor(**{**MODEL_PARAMS, **params}, n_jobs=n_jobs)
+    model.fit(preprocessor.transform(X), y)
+    return preprocessor, model
+
+
+def evaluate(X, y, n_jobs=None, test_size=0.2):
+    """
+    R2 scores of a model trained on a split of the features, with the notebook's split.
+    """
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=42)
+    preprocessor, model = fit_model(X_train, y_train, n_jobs)
+    return {
+        "train r2": r2_score(y_train, model.predict(preprocessor.transform(X_train))),
+        "test r2": r2_score(y_test, model.predict(preprocessor.transform(X_test))),
+    }
+
+
+def schema(registry, rare):
+    return {
+        "features": registry.feature_names,
+        "numerical": registry.numerical_features,
+        "categorical": {col: list(lookup) for col, lookup in zip(registry.categorical_features,
+                                                                  registry.encoder.category_columns)},
+        "other": rare,
+        "target": TARGET,
+    }
+
+
+def write_metadata(path, version, metadata):
+    """
+    Write metadata.json of a bundle, replacing the previous one at once since the bundle may already be served.
+    """
+    tmp = os.path.join(path, ".metadata.json")
+    with open(tmp, "w") as f:
+        json.dump({"version": version, **metadata}, f, indent=2)
+    os.replace(tmp, os.path.join(path, "metadata.json"))
+
+
+def write_bundle(output, registry, rare, metadata):
+    """
+    Save the bundle to a temporary directory, then move it to output/<version>.
+
+    Returns the path of the bundle.
+    """
+    os.makedirs(output, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=output, prefix=".bundle-")
+    registry.export(tmp)
+    version = artifact_version(os.path.join(tmp, ENCODER_FILE), *CompiledEnsemble.files(tmp))
+
+    joblib.dump(registry.preprocessor, os.path.join(tmp, "preprocessor.joblib"))
+    joblib.dump(registry.model, os.path.join(tmp, MODEL_FILE))
+    with open(os.path.join(tmp, "schema.json"), "w") as f:
+        json.dump(schema(registry, rare), f, indent=2)
+    write_metadata(tmp, version, metadata)
+
+    path = os.path.join(output, version)
+    # same model trained again, replace the previous bundle
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the pricing model and save it as a bundle.")
+    parser.add_argument("data", nargs="?", default=PRICING_PATH, help="raw pricing dataset")
+    parser.add_argument("--output", default="bundles", help="directory the bundle is saved in")
+    parser.add_argument("--n-jobs", type=int, default=None, help="processes fitting the trees, -1 uses every core")
+    parser.add_argument("--evaluate", action="store_true", help="also score a model trained on a train/test split")
+    args = parser.parse_args()
+
+    timings = {}
+    with stage(timings, "load"):
+        pricing = load_pricing(args.data)
+    with stage(timings, "prepare"):
+        X, y, rare = prepare_features(pricing)
+    scores = {}
+    if args.evaluate:
+        with stage(timings, "evaluate"):
+            scores = evaluate(X, y, args.n_jobs)
+    with stage(timings, "fit"):
+        preprocessor, model = fit_model(X, y, args.n_jobs)
+        # predict sums the estimators in the order of the jobs, with a single job it is bit for bit
+        # identical to the exported arrays
+        model.n_jobs = None
+    with stage(timings, "export"):
+        registry = ModelRegistry(preprocessor, model)
+        metadata = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "data": os.path.basename(args.data),
+            "rows": len(X),
+            "model": type(model).__name__,
+            "params": {**MODEL_PARAMS, "n_jobs": args.n_jobs},
+            "other share": OTHER_SHARE,
+            "scores": scores,
+            "timings": timings,
+            "versions": {"python": platform.python_version(), "numpy": np.__version__,
+                         "pandas": pd.__version__, "scikit-learn": sklearn.__version__},
+        }
+        path = write_bundle(args.output, registry, rare, metadata)
+    # again with the duration of the export
+    write_metadata(path, os.path.basename(path), metadata)
+
+    print(f"bundle saved to {path}")
+    for name, score in scores.items():
+        print(f"{name:<10} {score:.4f}")
+    for name, seconds in timings.items():
+        print(f"{name:<10} {seconds * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Precompute the delay percentiles shown on the dashboard as possible thresholds.
+
+Reading the rentals and recomputing the percentiles on every Streamlit rerun
+is slow, so they are computed once and saved to a small .npz file:
+
+    python aggregates.py
+
+app.py loads that file (or computes it, the first time) and keeps it in memory between reruns.
+"""
+# imports
+import math
+import os
+import numpy as np
+from ingest import read_table
+
+OUTLIERS_PATH = "Data/df_wo_outliers.xlsx"
+AGGREGATES_PATH = "Data/aggregates.npz"
+
+# width of the histogram bins, in minutes
+BIN_MINUTES = 5
+
+# percentiles of the delays shown as possible thresholds
+PERCENTILES = list(range(10, 110, 10))
+
+
+def compute_aggregates(df):
+    """
+    Percentiles of the delays of late returns, from the rentals without outliers.
+    """
+    delays = df["delay_minutes"].to_numpy(dtype=np.float64)
+    late_delays = delays[delays > 0]
+
+    return {
+        "percentiles": np.array(PERCENTILES),
+        "percentile_minutes": np.array([math.trunc(np.percentile(late_delays, p)) for p in PERCENTILES]),
+    }
+
+
+def save_aggregates(aggregates, path=AGGREGATES_PATH):
+    np.savez(path, **aggregates)
+
+
+def load_aggregates(path=AGGREGATES_PATH, outliers_path=OUTLIERS_PATH):
+    """
+    Load the precomputed figures, computing and saving them first when the file is missing or older than the data.
+    """
+    # rentals are read from their Parquet version when ingest.py created it
+    parquet_path = os.path.splitext(outliers_path)[0] + ".parquet"
+    data_path = parquet_path if os.path.exists(parquet_path) else outliers_path
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(data_path):
+        save_aggregates(compute_aggregates(read_table(outliers_path)), path)
+    with np.load(path) as f:
+        return {name: f[name] for name in f.files}
+
+
+if __name__ == "__main__":
+    aggregates = compute_aggregates(read_table(OUTLIERS_PATH))
+    save_aggregates(aggregates)
+    print(f"aggregates saved to {AGGREGATES_PATH}")
@@ -0,0 +1,124 @@
+"""
+Binned counts of the rentals for the dashboard charts, filtered by checkin type and state.
+
+Charts only need the counts of each bin, not the rentals: the rentals are turned once into NumPy arrays
+(delay, category codes, outlier flag, bin of the delay), and every filter is a boolean mask
+followed by np.bincount. The result has one value per bin whatever the number of rentals,
+so the page sent to the browser keeps the same size as the logs grow.
+
+The rental logs have no date column, so there is no date range filter.
+"""
+# imports
+import math
+import numpy as np
+
+from aggregates import BIN_MINUTES
+from ingest import outlier_bounds
+
+# categorical columns that can be filtered on
+FILTERS = ["checkin_type", "state"]
+
+
+class RentalAnalytics:
+    """
+    Arrays of every rental, built once by from_rentals.
+
+    delays: minutes, NaN for rentals without a checkout delay (e.g. canceled)
+    gaps: minutes between the rental and the previous one of the same car, NaN without a previous rental
+    codes: {column: category code of every rental}, categories: {column: category of every code}
+    outliers: delays more than 1.5 times the IQR away from the quartiles, like the dashboard's dataset
+    """
+
+    def __init__(self, delays, gaps, codes, categories, outliers, width=BIN_MINUTES):
+        self.delays = delays
+        self.gaps = gaps
+        self.codes = codes
+        self.categories = categories
+        self.outliers = outliers
+        self.width = width
+        # bins of the delays without outliers, aligned on multiples of the width, shared by every filter
+        # so that charts can be compared; outliers are counted in the first or last bin
+        inliers = delays[~np.isnan(delays) & ~outliers]
+        self.start = math.floor(inliers.min() / width) * width
+        self.n_bins = math.floor(inliers.max() / width) + 1 - self.start // width
+        bins = np.floor((np.nan_to_num(delays) - self.start) / width)
+        self.bins = np.clip(bins, 0, self.n_bins - 1).astype(np.intp)
+
+    @classmethod
+    def from_rentals(cls, df, width=BIN_MINUTES):
+        """
+        Build the arrays from the cleaned rentals (see ingest.py).
+        """
+        delays = df["delay_minutes"].to_numpy(dtype=np.float64, na_value=np.nan)
+        gaps = df["difference_rentals_minutes"].to_numpy(dtype=np.float64, na_value=np.nan)
+        lower, upper = outlier_bounds(delays[~np.isnan(delays)])
+        outliers = ~np.isnan(delays) & ((delays < lower) | (delays > upper))
+
+        codes = {}
+        categories = {}
+        for col in FILTERS:
+            values = df[col].astype("category")
+            codes[col] = values.cat.codes.to_numpy()
+            categories[col] = [str(category) for category in values.cat.categories]
+        return cls(delays, gaps, codes, categories, outliers, width)
+
+    @property
+    def edges(self):
+        return self.start + self.width * np.arange(self.n_bins + 1)
+
+    def mask(self, include_outliers=False, **filters):
+        """
+        Rentals matching the filters, {column: category or list of categories}, None keeps every category.
+        """
+        mask = np.ones(len(self.delays), dtype=bool) if include_outliers else ~self.outliers
+        for col, values in filters.items():
+            if values is None:
+                continue
+            if col not in self.codes:
+                raise ValueError(f"unknown filter {col!r}, options are {FILTERS}")
+            values = [values] if isinstance(values, str) else values
+            wanted = [self.categories[col].index(value) for value in values if value in self.categories[col]]
+            mask &= np.isin(self.codes[col], wanted)
+        return mask
+
+    def counts(self, col, include_outliers=False, **filters):
+        """
+        Number of rentals of every category of col, for the rentals matching the filters.
+        """
+        mask = self.mask(include_outliers, **filters)
+        return self.categories[col], np.bincount(self.codes[col][mask], minlength=len(self.categories[col]))
+
+    def delay_bins(self, include_outliers=False, **filters):
+        """
+        Histogram of the delays of the rentals matching the filters, split between early and late returns.
+
+        Returns a dictionary with the bin edges, the counts of early and late returns in every bin,
+        the number of matching rentals and how many of them have a delay, and the share of late returns in %.
+        """
+        mask = self.mask(include_outliers, **filters)
+        with_delay = mask & ~np.isnan(self.delays)
+        late = with_delay & (self.delays > 0)
+        early = with_delay & ~late
+        n_late = int(late.sum())
+        n_delays = int(with_delay.sum())
+        return {
+            "edges": self.edges,
+            "early": np.bincount(self.bins[early], minlength=self.n_bins),
+            "late": np.bincount(self.bins[late], minlength=self.n_bins),
+            "rentals": int(mask.sum()),
+            "with delay": n_delays,
+            "late share": round(n_late / n_delays * 100, 2) if n_delays else 0.0,
+        }
+
+    def medians(self, include_outliers=False, **filters):
+        """
+        Median delay of the late returns and median minutes between rentals, for the rentals with a delay
+        matching the filters, like aggregates.py does for every rental. NaN when no rental matches.
+        """
+        mask = self.mask(include_outliers, **filters) & ~np.isnan(self.delays)
+        late_delays = self.delays[mask & (self.delays > 0)]
+        gaps = self.gaps[mask & ~np.isnan(self.gaps)]
+        return {
+            "median_delay": np.median(late_delays) if len(late_delays) else np.nan,
+            "median_diff_rentals": np.median(gaps) if len(gaps) else np.nan,
+        }
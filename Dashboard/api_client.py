@@ -0,0 +1,89 @@
+"""
+Client of the pricing API, shared by every rerun of the dashboard.
+
+Connections are pooled and reused, every call has a timeout, and failed calls (connection errors,
+502/503/504) are retried with exponential backoff. Predictions do not change anything on the API,
+so POST requests are safe to retry. Read timeouts are not retried: the API may still be working on a slow batch,
+sending it again would only add load when the API is already overloaded.
+
+Settings come from environment variables:
+
+- GETAROUND_API_URL: base URL of the API, default http://host.docker.internal:4001
+- GETAROUND_API_CONNECT_TIMEOUT, GETAROUND_API_READ_TIMEOUT: seconds, default 3 and 10
+- GETAROUND_API_RETRIES: default 3
+"""
+# imports
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+API_URL = os.environ.get("GETAROUND_API_URL", "http://host.docker.internal:4001")
+CONNECT_TIMEOUT = float(os.environ.get("GETAROUND_API_CONNECT_TIMEOUT", 3))
+READ_TIMEOUT = float(os.environ.get("GETAROUND_API_READ_TIMEOUT", 10))
+RETRIES = int(os.environ.get("GETAROUND_API_RETRIES", 3))
+
+
+def error_detail(response):
+    """
+    Error message of an API error response, the detail of FastAPI's errors or the response text.
+    """
+    try:
+        detail = response.json()["detail"]
+    except (ValueError, KeyError, TypeError):
+        return response.text
+    # request validation errors are a list of {"loc", "msg", ...}
+    if isinstance(detail, list):
+        return "; ".join(f'{".".join(map(str, error.get("loc", [])))}: {error.get("msg")}' for error in detail)
+    return str(detail)
+
+
+class PricingClient:
+
+    def __init__(self, base_url=API_URL, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 retries=RETRIES, backoff_factor=0.3, pool_size=10):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            backoff_factor=backoff_factor,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=["GET", "POST"],
+            raise_on_status=False,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size))
+        self.session.mount("https://", HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size))
+
+    def _post(self, endpoint, payload):
+        r = self.session.post(f"{self.base_url}/{endpoint}", json=payload, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def predict(self, car):
+        """
+        Optimal price of one car, a dictionary with the inputs of the API's /predict.
+        """
+        return self._post("predict", car)["optimal price"]
+
+    def batch_predict(self, cars):
+        """
+        Optimal prices of a list of cars in a single request.
+
+        Returns the prices, None for cars the API could not predict, and the API's errors.
+        """
+        response = self._post("batch_predict", cars)
+        return response["optimal price"], response["errors"]
+
+    def price_grid(self, car, grid=None, ranges=None):
+        """
+        Optimal prices of a car over every combination of values of some features, in a single request.
+
+        grid is {feature: list of values} and ranges {feature: {"start", "stop", "step"}}, see the API's /price_grid.
+        """
+        return self._post("price_grid", {"car": car, "grid": grid or {}, "ranges": ranges or {}})
+
+    def close(self):
+        self.session.close()
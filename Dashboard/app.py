@@ -1,19 +1,42 @@
 # imports
+import itertools
 import pandas as pd
 import streamlit as st
 import plotly
 import plotly.graph_objects as go
-import plotly.express as px
 import numpy as np
-import math
 import requests
+from aggregates import load_aggregates
+from analytics import RentalAnalytics
+from api_client import PricingClient, error_detail
+from ingest import load_rentals
+from simulation import DelaySimulator, SCOPES
 
 # import data
-# use dataframe without outliers
-outliers_path = "Data/df_wo_outliers.xlsx"
-df = pd.read_excel(outliers_path)
-pricing_path = "Data/get_around_pricing_project.csv"
-pricing = pd.read_csv(pricing_path)
+# figures of the dataframe without outliers are precomputed (see aggregates.py),
+# and kept in memory so that widget interactions do not read the data again
+@st.cache_resource
+def get_aggregates():
+    return load_aggregates()
+
+@st.cache_resource
+def get_rentals():
+    return load_rentals()
+
+# rentals are joined to their previous rental once, then any threshold and scope is a binary search
+@st.cache_resource
+def get_simulator():
+    return DelaySimulator.from_rentals(get_rentals())
+
+# rentals are turned into arrays once, then any filter of the charts is a few bincounts
+@st.cache_resource
+def get_analytics():
+    return RentalAnalytics.from_rentals(get_rentals())
+
+# one client, with its pool of connections to the API, for every session and rerun
+@st.cache_resource
+def get_client():
+    return PricingClient()
 
 # set page configuration
 st.set_page_config(
@@ -22,6 +45,10 @@ st.set_page_config(
     layout="wide"
 )
 
+agg = get_aggregates()
+simulator = get_simulator()
+analytics = get_analytics()
+
 tab1, tab2 = st.tabs(["Dashboard", "Price Optimizer"])
 
 with tab1:
@@ -41,19 +68,31 @@ with tab1:
 
     # questions to be answered
     st.header("Data Analysis")
+
+    # filters of the charts, counts are binned on the server and only the bins are sent to the browser
+    col1, col2 = st.columns(2)
+    with col1:
+        checkin_filter = st.radio("Checkin type", ["all"] + analytics.categories["checkin_type"], horizontal=True)
+    with col2:
+        state_filter = st.radio("State", ["all"] + analytics.categories["state"], horizontal=True)
+    filters = {
+        "checkin_type": None if checkin_filter == "all" else checkin_filter,
+        "state": None if state_filter == "all" else state_filter,
+    }
+    delay_bins = analytics.delay_bins(**filters)
+    st.caption(f'{delay_bins["rentals"]} rentals, {delay_bins["with delay"]} with a checkout delay, outliers excluded')
     st.divider()
 
     # QUESTION 1
     st.subheader("How often are drivers late for the next check-in? How does it impact the next driver?")
 
     # metric
-    perc_delays = round((len(df[df["delay_minutes"] > 0]) / len(df)) * 100 ,2)
-    st.metric("% of Delays", perc_delays)
+    perc_delays = delay_bins["late share"]
+    st.metric("% of Delays", perc_delays if delay_bins["with delay"] else "-")
 
     # graph
-    labels = {"late":""}
-    fig1 = px.histogram(df, "late",
-                        labels=labels)
+    fig1 = go.Figure(go.Bar(x=["Early", "Late"], y=[delay_bins["early"].sum(), delay_bins["late"].sum()]))
+    fig1.update_layout(yaxis_title="count")
     st.plotly_chart(fig1, use_container_width=True)
 
     st.divider()
@@ -61,20 +100,24 @@ with tab1:
     # QUESTION 2
     st.subheader("When there is a delay, how many minutes do late drivers take after programmed end of rental time?")
 
-    # metrics
+    # metrics, of the rentals matching the filters
+    medians = analytics.medians(**filters)
     col1, col2 = st.columns(2)
     with col1:
-        median_delay = df[df["delay_minutes"]>0]["delay_minutes"].median()
-        st.metric("Median Delay", median_delay)
+        median_delay = medians["median_delay"]
+        st.metric("Median Delay", "-" if np.isnan(median_delay) else median_delay)
 
     with col2:
-        median_diff_rentals = df["difference_rentals_minutes"].median()
-        st.metric("Median Minutes between Rentals", median_diff_rentals)
+        median_diff_rentals = medians["median_diff_rentals"]
+        st.metric("Median Minutes between Rentals", "-" if np.isnan(median_diff_rentals) else median_diff_rentals)
     # graph
-    labels = {"delay_minutes":"Delay in Minutes"}
-    fig2 = px.histogram(df, x="delay_minutes",
-                        color="late",
-                        labels=labels)
+    # bars are drawn at the middle of their bin
+    edges = delay_bins["edges"]
+    fig2 = go.Figure([
+        go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=delay_bins["early"], name="Early"),
+        go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=delay_bins["late"], name="Late")
+    ])
+    fig2.update_layout(barmode="stack", bargap=0, xaxis_title="Delay in Minutes", yaxis_title="count", legend_title="late")
     st.plotly_chart(fig2, use_container_width=True)
 
     st.divider()
@@ -87,17 +130,10 @@ with tab1:
 
     # use percentiles as thresholds, from 10 to 100
     # values will be % of EARLY check ins that would be early, for each threshold
-    percentiles_delay = {}
-    for percentile in range(10,110,10):
-        percentiles_delay[percentile] = \
-            math.trunc(np.percentile(df[df["delay_minutes"]>0]["delay_minutes"], percentile))
-        
-    # convert to dataframe    
-    thresholds = pd.DataFrame.from_dict(percentiles_delay, orient="index").reset_index()
-    thresholds.rename(columns={"index": "Percentage of Early Check Ins",
-                            0: "Minutes Threshold"},
-                            inplace=True)
-    thresholds = thresholds
+    # computed on every rental, not only the filtered ones: the scope of the feature is chosen below
+    st.caption("Thresholds are computed on all rentals, the filters above do not apply to them.")
+    thresholds = pd.DataFrame({"Percentage of Early Check Ins": agg["percentiles"],
+                               "Minutes Threshold": agg["percentile_minutes"]})
     # show table
     st.table(thresholds.T)
 
@@ -112,16 +148,46 @@ with tab1:
             st.metric("Percentage of Early Checkins", perc_early_checkins)
 
     # graph
-    delay = df[df["delay_minutes"]>0]
-    labels = {"delay_minutes":"Delay in Minutes"}
-    fig3 = px.histogram(delay, x="delay_minutes",
-                        labels=labels,
-                        title="Threshold for Early Checkins")
+    # late returns only, from the first bin with positive delays
+    first = np.searchsorted(delay_bins["edges"], 0, side="right") - 1
+    edges = delay_bins["edges"][first:]
+    fig3 = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=delay_bins["late"][first:]))
+    fig3.update_layout(bargap=0, title="Threshold for Early Checkins", xaxis_title="Delay in Minutes", yaxis_title="count")
     fig3.add_vline(x=selected_threshold,
                 line_width=5,
                 line_color="red")
     st.plotly_chart(fig3, use_container_width=True)
 
+    # simulation of the feature
+    st.markdown("##### Simulate the minimum delay between rentals")
+    col1, col2 = st.columns(2)
+    with col1:
+        scope = st.radio("Scope:", list(SCOPES), format_func=lambda scope: "All cars" if scope=="all" else "Connect cars only", horizontal=True)
+    with col2:
+        simulated_threshold = st.slider("Minimum Delay in Minutes:", min_value=0, max_value=720, value=120, step=15)
+
+    result = simulator.simulate(simulated_threshold, scope)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Affected Rentals", int(result["affected rentals"]))
+    with col2:
+        st.metric("% of Rentals (Owner Revenue) Affected", round(float(result["affected share"]) * 100, 2))
+    with col3:
+        st.metric("Problematic Cases Solved", f'{int(result["solved cases"])} / {result["problematic cases"]}')
+
+    # graph, every threshold at once
+    simulated_thresholds = np.arange(0, 721, 15)
+    curve = simulator.simulate(simulated_thresholds, scope)
+    fig4 = go.Figure([
+        go.Scatter(x=simulated_thresholds, y=curve["affected share"] * 100, name="% of rentals affected"),
+        go.Scatter(x=simulated_thresholds, y=curve["solved share"] * 100, name="% of problematic cases solved")
+    ])
+    fig4.add_vline(x=simulated_threshold,
+                line_width=3,
+                line_color="red")
+    fig4.update_layout(xaxis_title="Minimum Delay in Minutes", yaxis_title="%")
+    st.plotly_chart(fig4, use_container_width=True)
+
     st.divider()
 
     # chosen threshold
@@ -185,15 +251,92 @@ with tab2:
     "winter_tires": winter_tires
     }
 
+    # errors of the API, e.g. an unknown category or too many cars, are shown with the API's detail
+    def show_api_error(e):
+        if isinstance(e, requests.HTTPError) and e.response is not None:
+            st.error(f"The pricing API rejected the request ({e.response.status_code}): {error_detail(e.response)}")
+        else:
+            st.error(f"The pricing API could not be reached: {e}")
+
     # request prediction from API
     def predict_price(data):
-        api_input = data
-        r = requests.post("http://host.docker.internal:4001/predict", json=api_input)
-        st.write(r.json())
+        try:
+            return get_client().predict(data)
+        except requests.RequestException as e:
+            show_api_error(e)
 
     # submit button
     if st.button('Submit'):
             # Display output
             st.subheader("Optimal Price:")
             output = predict_price(data)
-            st.write(output)
\ No newline at end of file
+            st.write(output)
+
+    st.divider()
+
+    # price over a grid of mileages and equipment, scored by the API in a single request
+    st.markdown("#### How do mileage and equipment change your price?")
+    equipment = st.multiselect(
+        label="Equipment to compare",
+        options=["has_gps", "winter_tires", "has_speed_regulator", "has_air_conditioning", "automatic_car",
+                 "private_parking_available", "has_getaround_connect"],
+        default=["has_gps", "winter_tires", "has_speed_regulator"]
+    )
+    max_mileage = st.slider(label="Mileage up to", min_value=50000, max_value=400000, value=200000, step=50000)
+
+    if st.button("Compare"):
+        grid = {feature: [0, 1] for feature in equipment}
+        ranges = {"mileage": {"start": 0, "stop": max_mileage, "step": max_mileage // 20}}
+        try:
+            result = get_client().price_grid(data, grid, ranges)
+        except requests.RequestException as e:
+            show_api_error(e)
+        else:
+            best = result["best"]
+            st.metric("Best optimal price", f'{best["optimal price"]:.2f}')
+            st.write(best["features"])
+
+            # mileage is the last feature of the grid, one line per combination of equipment
+            mileages = result["values"][-1]
+            prices = np.array(result["optimal price"]).reshape(-1, len(mileages))
+            combinations = itertools.product(*result["values"][:-1])
+            fig5 = go.Figure([
+                go.Scatter(x=mileages, y=line, mode="lines",
+                           name=", ".join(f"{feature}={value}" for feature, value in zip(equipment, combination)) or "car")
+                for combination, line in zip(combinations, prices)
+            ])
+            fig5.update_layout(xaxis_title="Mileage", yaxis_title="Optimal Price")
+            st.plotly_chart(fig5, use_container_width=True)
+
+    st.divider()
+
+    # several cars at once
+    st.markdown("#### Own a fleet? Price all of your cars at once")
+    st.markdown("##### Add one row per car, or upload a CSV file with the same columns, then click \"Price all cars\".")
+
+    uploaded = st.file_uploader("Cars CSV", type="csv")
+    fleet = pd.DataFrame([data])
+    if uploaded is not None:
+        try:
+            cars = pd.read_csv(uploaded)
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+            st.error(f"The file could not be read as a CSV: {e}")
+        else:
+            missing = [col for col in data if col not in cars.columns]
+            if missing:
+                st.error(f"The file is missing the columns {missing}")
+            else:
+                fleet = cars
+    fleet = st.data_editor(fleet[list(data)], num_rows="dynamic", use_container_width=True)
+
+    if st.button("Price all cars"):
+        cars = fleet.dropna().to_dict(orient="records")
+        try:
+            # a single request for the whole fleet
+            prices, errors = get_client().batch_predict(cars)
+        except requests.RequestException as e:
+            show_api_error(e)
+        else:
+            st.dataframe(pd.DataFrame(cars).assign(**{"Optimal Price": prices}), use_container_width=True)
+            for error in errors:
+                st.warning(f'Car {error["row"] + 1}: {error["detail"]}')
@@ -0,0 +1,47 @@
+# time to load each dataset from its raw Excel/CSV file and from the Parquet file written by ingest.py
+# run from the Dashboard folder, after python ingest.py: python -m benchmarks.load
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from ingest import read_raw
+
+DATASETS = [
+    "Data/get_around_delay_analysis.xlsx",
+    "Data/df_wo_outliers.xlsx",
+    "Data/thresholds.xlsx",
+]
+
+# rentals.parquet is the Parquet version of the raw delay analysis
+PARQUET_NAMES = {"get_around_delay_analysis": "rentals"}
+
+
+def best_of(func, repeats):
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return np.min(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    for path in DATASETS:
+        folder, name = os.path.split(os.path.splitext(path)[0])
+        parquet_path = os.path.join(folder, PARQUET_NAMES.get(name, name) + ".parquet")
+        if not os.path.exists(parquet_path):
+            print(f"{parquet_path} is missing, run python ingest.py first")
+            continue
+        raw = best_of(lambda: read_raw(path), args.repeats)
+        parquet = best_of(lambda: pd.read_parquet(parquet_path), args.repeats)
+        print(f"{path:<40} raw: {raw:9.1f} ms  parquet: {parquet:7.1f} ms  speedup: {raw / parquet:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
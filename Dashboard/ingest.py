@@ -0,0 +1,138 @@
+"""
+Convert the raw rental logs to typed Parquet files.
+
+Excel parsing is very slow compared to reading a columnar file, and gets worse with every month of logs.
+This reads the raw delay analysis exports (.xlsx or .csv, any number of them) once and writes:
+
+- Data/rentals.parquet: every rental, with the notebook's column names
+- Data/df_wo_outliers.parquet: rentals with a delay, without delays outside 1.5 * IQR, with the "late" column
+- Data/thresholds.parquet: thresholds table of the notebook
+
+    python ingest.py
+    python ingest.py logs/*.csv --output Data
+
+checkin_type, state and late are categoricals, ids and minutes are nullable integers.
+"""
+# imports
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+RAW_PATHS = ["Data/get_around_delay_analysis.xlsx"]
+THRESHOLDS_PATH = "Data/thresholds.xlsx"
+OUTPUT_DIR = "Data"
+
+# rename columns that are too long, same as in the notebook
+COLUMNS = {
+    "delay_at_checkout_in_minutes": "delay_minutes",
+    "time_delta_with_previous_rental_in_minutes": "difference_rentals_minutes",
+}
+
+DTYPES = {
+    "rental_id": "Int64",
+    "car_id": "Int64",
+    "checkin_type": "category",
+    "state": "category",
+    "delay_minutes": "Int64",
+    "previous_ended_rental_id": "Int64",
+    "difference_rentals_minutes": "Int64",
+}
+
+
+def read_raw(path):
+    if path.endswith(".csv"):
+        return pd.read_csv(path)
+    return pd.read_excel(path)
+
+
+def clean_rentals(df):
+    """
+    Rename and type the columns of raw rentals, keeping one row per rental.
+    """
+    df = df.rename(columns=COLUMNS)
+    df = df[list(DTYPES)]
+    df = df.drop_duplicates(subset="rental_id", keep="last")
+    # minutes are whole numbers, stored as floats only because of missing values
+    df = df.astype({col: "float64" for col, dtype in DTYPES.items() if dtype == "Int64"})
+    df = df.astype(DTYPES)
+    return df.reset_index(drop=True)
+
+
+def outlier_bounds(delays):
+    """
+    Lower and upper whiskers of the delays, 1.5 times the IQR away from the quartiles.
+    """
+    Q1, Q3 = np.percentile(delays, [25, 75])
+    IQR = Q3 - Q1
+    return Q1 - 1.5 * IQR, Q3 + 1.5 * IQR
+
+
+def remove_outliers(df):
+    """
+    Rentals with a delay, without delays more than 1.5 times the IQR away from the quartiles, like in the notebook.
+    """
+    df_wo_nan = df.dropna(subset=["delay_minutes"])
+    delays = df_wo_nan["delay_minutes"].to_numpy(dtype=np.float64)
+    lower_whisker, upper_whisker = outlier_bounds(delays)
+
+    df_wo_outliers = df_wo_nan[(delays >= lower_whisker) & (delays <= upper_whisker)].copy()
+    df_wo_outliers["late"] = pd.Categorical(
+        np.where(df_wo_outliers["delay_minutes"] <= 0, "Early", "Late"), categories=["Early", "Late"])
+    return df_wo_outliers.reset_index(drop=True)
+
+
+def ingest(raw_paths=RAW_PATHS, thresholds_path=THRESHOLDS_PATH, output_dir=OUTPUT_DIR):
+    """
+    Write the Parquet files, returns their paths.
+    """
+    rentals = clean_rentals(pd.concat([read_raw(path) for path in raw_paths], ignore_index=True))
+    outputs = {
+        "rentals": rentals,
+        "df_wo_outliers": remove_outliers(rentals),
+    }
+    if thresholds_path and os.path.exists(thresholds_path):
+        outputs["thresholds"] = read_raw(thresholds_path)
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, df in outputs.items():
+        path = os.path.join(output_dir, f"{name}.parquet")
+        df.to_parquet(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def read_table(path):
+    """
+    Read a dataset, from its Parquet version when ingest.py created one next to it.
+    """
+    parquet_path = os.path.splitext(path)[0] + ".parquet"
+    if os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path)
+    return read_raw(path)
+
+
+def load_rentals(raw_paths=RAW_PATHS, output_dir=OUTPUT_DIR):
+    """
+    Every rental, from rentals.parquet when ingest.py created it, otherwise cleaned from the raw files.
+    """
+    parquet_path = os.path.join(output_dir, "rentals.parquet")
+    if os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path)
+    return clean_rentals(pd.concat([read_raw(path) for path in raw_paths], ignore_index=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert raw rental logs to typed Parquet files.")
+    parser.add_argument("raw", nargs="*", default=RAW_PATHS, help="raw delay analysis files, .xlsx or .csv")
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH)
+    parser.add_argument("--output", default=OUTPUT_DIR, help="directory to write the Parquet files to")
+    args = parser.parse_args()
+
+    for path in ingest(args.raw, args.thresholds, args.output):
+        print(f"{path}: {len(pd.read_parquet(path))} rows")
+
+
+if __name__ == "__main__":
+    main()
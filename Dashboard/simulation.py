@@ -0,0 +1,90 @@
+"""
+Simulate the minimum delay between two rentals, for any threshold and scope.
+
+With a threshold of T minutes, a rental can no longer be booked less than T minutes after the end of
+the previous rental of the same car. For a threshold and a scope (every car, or Connect cars only):
+
+- affected rentals: rentals in scope that started less than T minutes after the previous one,
+  they would not have been possible, and their revenue is lost for the owner
+- problematic cases: rentals in scope whose previous rental was returned later than the time between them,
+  so the driver had to wait
+- solved cases: problematic cases whose previous rental was late by T minutes or less,
+  the minimum delay would have absorbed the late return
+
+Rentals are joined to their previous rental once, then the differences between rentals and the delays of the
+previous rentals are sorted per checkin type, so any query is a binary search in those arrays.
+"""
+# imports
+import numpy as np
+
+# scopes of the feature, and the checkin types they apply to
+SCOPES = {
+    "all": ["connect", "mobile"],
+    "connect": ["connect"],
+}
+
+
+class DelaySimulator:
+    """
+    Sorted arrays of one checkin type each, built once by from_rentals.
+
+    differences: minutes between the end of the previous rental and the start of each rental with a previous rental
+    late_delays: delays of the previous rental of every problematic case
+    """
+
+    def __init__(self, rentals, differences, late_delays):
+        # total number of rentals, and sorted arrays, per checkin type
+        self.rentals = rentals
+        self.differences = differences
+        self.late_delays = late_delays
+
+    @property
+    def total_rentals(self):
+        return sum(self.rentals.values())
+
+    @classmethod
+    def from_rentals(cls, df):
+        """
+        Build the simulator from the cleaned rentals (see ingest.py).
+        """
+        previous = df[["rental_id", "delay_minutes"]].rename(
+            columns={"rental_id": "previous_ended_rental_id", "delay_minutes": "previous_delay_minutes"})
+        chained = df.dropna(subset=["previous_ended_rental_id", "difference_rentals_minutes"]).merge(
+            previous, on="previous_ended_rental_id", how="left")
+
+        differences = chained["difference_rentals_minutes"].to_numpy(dtype=np.float64)
+        previous_delays = chained["previous_delay_minutes"].to_numpy(dtype=np.float64, na_value=np.nan)
+        checkin_types = chained["checkin_type"].astype(str).to_numpy()
+        # previous rentals with an unknown delay are not counted as problematic
+        problematic = previous_delays > differences
+
+        checkin_counts = df["checkin_type"].astype(str).value_counts()
+        rentals, sorted_differences, late_delays = {}, {}, {}
+        for checkin_type in SCOPES["all"]:
+            of_type = checkin_types == checkin_type
+            rentals[checkin_type] = int(checkin_counts.get(checkin_type, 0))
+            sorted_differences[checkin_type] = np.sort(differences[of_type])
+            late_delays[checkin_type] = np.sort(previous_delays[of_type & problematic])
+        return cls(rentals, sorted_differences, late_delays)
+
+    def simulate(self, threshold, scope="all"):
+        """
+        Affected rentals and solved cases for a threshold in minutes, or an array of thresholds.
+        """
+        threshold = np.asarray(threshold, dtype=np.float64)
+        affected = 0
+        problematic = 0
+        solved = 0
+        for checkin_type in SCOPES[scope]:
+            affected = affected + np.searchsorted(self.differences[checkin_type], threshold, side="left")
+            problematic += len(self.late_delays[checkin_type])
+            solved = solved + np.searchsorted(self.late_delays[checkin_type], threshold, side="right")
+
+        return {
+            "affected rentals": affected,
+            # share of every rental, which is the share of owners' revenue when rentals have similar prices
+            "affected share": affected / self.total_rentals,
+            "problematic cases": problematic,
+            "solved cases": solved,
+            "solved share": solved / problematic if problematic else np.zeros_like(threshold),
+        }
@@ -0,0 +1,216 @@
+"""
+Delay statistics that are updated as new rental logs arrive, without rescanning the history.
+
+For every (checkin_type, state) group the store keeps the number of rentals, a histogram of delay_minutes
+and a KLL quantile sketch of delay_minutes. Approximate percentiles and the IQR outlier bounds used to build
+df_wo_outliers can be read at any time, for one group or any combination of them.
+
+    python stats_store.py logs/2017-05.csv logs/2017-06.csv --store Data/delay_stats.pkl
+"""
+# imports
+import argparse
+import os
+import pickle
+import numpy as np
+
+from aggregates import BIN_MINUTES
+from ingest import clean_rentals, read_raw
+
+STORE_PATH = "Data/delay_stats.pkl"
+
+
+class KLLSketch:
+    """
+    Streaming quantile sketch (Karnin, Lang and Liberty).
+
+    Values are kept in levels of compactors, a value of level h stands for 2 ** h values of the stream.
+    When the sketch is full, the first level over its capacity is sorted and every other value is promoted
+    to the next level, so memory stays around 3 * k values whatever the size of the stream,
+    and the rank error is about 1.7 / k.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+
+    def _compress(self):
+        while sum(len(level) for level in self.levels) > sum(self._capacity(h) for h in range(len(self.levels))):
+            for h, level in enumerate(self.levels):
+                if len(level) >= self._capacity(h):
+                    if h + 1 == len(self.levels):
+                        self.levels.append(np.empty(0))
+                    level = np.sort(level)
+                    # an odd value out stays at this level
+                    keep = level[:len(level) % 2]
+                    promoted = level[len(level) % 2:][self._rng.integers(2)::2]
+                    self.levels[h] = keep
+                    self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+                    break
+
+    def merge(self, other):
+        """
+        Add the values of another sketch to this one.
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """
+        Approximate quantile(s), q between 0 and 1.
+        """
+        if self.n == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        values = values[order]
+        cumulative = np.cumsum(weights[order])
+        ranks = np.asarray(q) * cumulative[-1]
+        positions = np.minimum(np.searchsorted(cumulative, ranks, side="left"), len(values) - 1)
+        return values[positions]
+
+
+class Histogram:
+    """
+    Counts of values in fixed width bins, growing to the left or right as values arrive.
+    """
+
+    def __init__(self, width=BIN_MINUTES):
+        self.width = width
+        self.start = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        bins = np.floor(values / self.width).astype(np.int64)
+        start = min(bins.min(), self.start) if len(self.counts) else bins.min()
+        stop = max(bins.max() + 1, self.start + len(self.counts))
+        counts = np.zeros(stop - start, dtype=np.int64)
+        counts[self.start - start:self.start - start + len(self.counts)] = self.counts
+        counts += np.bincount(bins - start, minlength=stop - start)
+        self.start, self.counts = start, counts
+
+    def merge(self, other):
+        if len(other.counts):
+            start = min(self.start, other.start) if len(self.counts) else other.start
+            stop = max(self.start + len(self.counts), other.start + len(other.counts))
+            counts = np.zeros(stop - start, dtype=np.int64)
+            counts[self.start - start:self.start - start + len(self.counts)] += self.counts
+            counts[other.start - start:other.start - start + len(other.counts)] += other.counts
+            self.start, self.counts = start, counts
+        return self
+
+    @property
+    def edges(self):
+        return (self.start + np.arange(len(self.counts) + 1)) * self.width
+
+
+class RentalStatsStore:
+    """
+    Counts, delay histograms and delay sketches per (checkin_type, state), updated batch by batch.
+    """
+
+    def __init__(self, bin_minutes=BIN_MINUTES, k=200):
+        self.bin_minutes = bin_minutes
+        self.k = k
+        self.groups = {}
+
+    def append(self, df):
+        """
+        Add a batch of cleaned rentals (see ingest.clean_rentals).
+        """
+        for (checkin_type, state), group in df.groupby(["checkin_type", "state"], observed=True):
+            key = (str(checkin_type), str(state))
+            if key not in self.groups:
+                self.groups[key] = {
+                    "rentals": 0,
+                    "histogram": Histogram(self.bin_minutes),
+                    "sketch": KLLSketch(self.k),
+                }
+            stats = self.groups[key]
+            delays = group["delay_minutes"].to_numpy(dtype=np.float64, na_value=np.nan)
+            stats["rentals"] += len(group)
+            stats["histogram"].update(delays)
+            stats["sketch"].update(delays)
+
+    def _select(self, checkin_type=None, state=None):
+        return [
+            stats for (group_checkin_type, group_state), stats in self.groups.items()
+            if checkin_type in (None, group_checkin_type) and state in (None, group_state)
+        ]
+
+    def count(self, checkin_type=None, state=None):
+        return sum(stats["rentals"] for stats in self._select(checkin_type, state))
+
+    def histogram(self, checkin_type=None, state=None):
+        """
+        Counts and bin edges of the delays of the selected groups, None selects every group.
+        """
+        merged = Histogram(self.bin_minutes)
+        for stats in self._select(checkin_type, state):
+            merged.merge(stats["histogram"])
+        return merged.counts, merged.edges
+
+    def quantile(self, q, checkin_type=None, state=None):
+        merged = KLLSketch(self.k)
+        for stats in self._select(checkin_type, state):
+            merged.merge(stats["sketch"])
+        return merged.quantile(q)
+
+    def outlier_bounds(self, checkin_type=None, state=None, whisker=1.5):
+        """
+        Delays outside of (lower, upper) are outliers: whisker times the IQR away from the quartiles, like in the notebook.
+        """
+        Q1, Q3 = self.quantile([0.25, 0.75], checkin_type, state)
+        IQR = Q3 - Q1
+        return Q1 - whisker * IQR, Q3 + whisker * IQR
+
+    def save(self, path=STORE_PATH):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @classmethod
+    def load(cls, path=STORE_PATH):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add raw rental logs to the delay statistics store.")
+    parser.add_argument("raw", nargs="+", help="raw delay analysis files, .xlsx or .csv")
+    parser.add_argument("--store", default=STORE_PATH)
+    args = parser.parse_args()
+
+    store = RentalStatsStore.load(args.store) if os.path.exists(args.store) else RentalStatsStore()
+    for path in args.raw:
+        store.append(clean_rentals(read_raw(path)))
+    store.save(args.store)
+
+    lower, upper = store.outlier_bounds()
+    print(f"{store.count()} rentals, delay percentiles 25/50/75: {store.quantile([0.25, 0.5, 0.75])}")
+    print(f"outlier bounds: {lower} to {upper} minutes")
+
+
+if __name__ == "__main__":
+    main()